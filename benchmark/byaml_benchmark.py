@@ -0,0 +1,339 @@
+# Benchmarks decoding and encoding BYAML course files with byaml and binary_io, outside of Blender.
+#
+# Generates synthetic course trees of the given scales, times decoding, encoding and round-trips of them, and reports
+# their throughput and peak memory. Results are written as JSON to compare them with the results of other revisions:
+#
+#   python benchmark/byaml_benchmark.py --objs 1000,10000 --output new.json --compare old.json
+
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, _src_path)
+import binary_io  # noqa: E402
+import byaml  # noqa: E402
+import numpy  # noqa: E402
+
+
+# ---- Course Generation ----
+
+def make_course(obj_count, path_count=64, point_count=32, rail_count=16, string_count=1000, seed=0):
+    # Create a course tree resembling the sections of Mario Kart 8 courses: objects with transforms and parameters,
+    # areas, paths of path points, BYAML paths and a table of resource names.
+    rnd = random.Random(seed)
+    strings = [_make_string(rnd, i) for i in range(0, string_count)]
+    unit_ids = iter(range(0, 1 << 30))
+    root = {
+        "EffectSW": 0,
+        "HeadLight": 1,
+        "IsFirstLeft": False,
+        "IsJugemAbove": True,
+        "JugemAbove": 0,
+        "LapJugemPos": 1,
+        "LapNumber": 3,
+        "PatternNum": 0,
+        "MapObjIdList": sorted(rnd.sample(range(1000, 9000), min(string_count, 8000))),
+        "MapObjResList": strings,
+        "Obj": [_make_obj(rnd, next(unit_ids), strings) for i in range(0, obj_count)],
+        "Area": [_make_area(rnd, next(unit_ids)) for i in range(0, max(1, obj_count // 50))],
+        "Rails": [_make_rail(rnd, point_count) for i in range(0, rail_count)]
+    }
+    # Distribute the paths over the path sections.
+    sections = ("EnemyPath", "GlidePath", "GravityPath", "ItemPath", "LapPath", "ObjPath", "PullPath")
+    for i, section in enumerate(sections):
+        count = path_count // len(sections) + (1 if i < path_count % len(sections) else 0)
+        root[section] = [_make_path(rnd, next(unit_ids), point_count) for j in range(0, count)]
+    return root
+
+
+def _make_string(rnd, index):
+    # Create a unique resource name of varying length.
+    letters = "".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for i in range(0, rnd.randrange(4, 20)))
+    return "{}_{}".format(letters.capitalize(), index)
+
+
+def _make_float(rnd, scale=1000):
+    # Create a float which is stored exactly as a single, so that round-trips compare equal.
+    return rnd.randrange(-scale * 16, scale * 16) / 16
+
+
+def _make_vector(rnd, scale=1000):
+    return {"X": _make_float(rnd, scale), "Y": _make_float(rnd, scale), "Z": _make_float(rnd, scale)}
+
+
+def _make_obj(rnd, unit_id, strings):
+    obj = {
+        "ObjId": rnd.randrange(1000, 9000),
+        "UnitIdNum": unit_id,
+        "Translate": _make_vector(rnd),
+        "Rotate": _make_vector(rnd, 4),
+        "Scale": {"X": 1.0, "Y": 1.0, "Z": 1.0},
+        "Speed": _make_float(rnd, 100),
+        "TopView": rnd.random() < 0.5,
+        "NoCol": rnd.random() < 0.1,
+        "Single": True,
+        "Multi2P": True,
+        "Multi4P": rnd.random() < 0.8,
+        "WiFi": True,
+        "WiFi2P": rnd.random() < 0.8,
+        "Params": [_make_float(rnd, 10) if rnd.random() < 0.3 else 0.0 for i in range(0, 8)],
+        "ResName": rnd.choice(strings) if strings else ""
+    }
+    if rnd.random() < 0.2:
+        obj["Obj_Path"] = rnd.randrange(0, 64)
+        obj["Obj_PathPoint"] = rnd.randrange(0, 32)
+    return obj
+
+
+def _make_area(rnd, unit_id):
+    return {
+        "UnitIdNum": unit_id,
+        "AreaShape": rnd.randrange(0, 2),
+        "AreaType": rnd.randrange(0, 6),
+        "Translate": _make_vector(rnd),
+        "Rotate": _make_vector(rnd, 4),
+        "Scale": _make_vector(rnd, 50)
+    }
+
+
+def _make_path(rnd, unit_id, point_count):
+    points = []
+    for i in range(0, point_count):
+        points.append({
+            "CameraHeight": rnd.randrange(0, 4),
+            "GlideOnly": False,
+            "Index": i,
+            "Transform": rnd.random() < 0.1,
+            "Translate": _make_vector(rnd),
+            "Rotate": _make_vector(rnd, 4),
+            "Scale": {"X": 1.0, "Y": 1.0, "Z": 1.0}
+        })
+    return {"UnitIdNum": unit_id, "IsClosed": rnd.random() < 0.5, "RailType": 0, "Delete": False, "PathPt": points}
+
+
+def _make_rail(rnd, point_count):
+    points = numpy.zeros(point_count, byaml.Path().points.dtype)
+    points["position"] = [[_make_float(rnd) for i in range(0, 3)] for j in range(0, point_count)]
+    points["normal"] = (0, 1, 0)
+    points["unknown"] = range(0, point_count)
+    return byaml.Path(points)
+
+
+# ---- Measurement ----
+
+class _Sink(io.RawIOBase):
+    # A stream discarding the data written to it, remembering only the number of bytes.
+    def __init__(self):
+        super().__init__()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.size += len(b)
+        return len(b)
+
+
+class _Capture(io.BytesIO):
+    # A memory stream keeping its data after the writer closed it.
+    data = None
+
+    def close(self):
+        self.data = self.getvalue()
+        super().close()
+
+
+def encode(root, **kwargs):
+    file = byaml.File()
+    file.root = root
+    stream = _Capture()
+    file.save_raw(stream, **kwargs)
+    return stream.data
+
+
+def measure(function, repeat):
+    # Time the function the given number of times and measure its peak memory in one additional traced run.
+    times = []
+    for i in range(0, repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak
+
+
+def run_scale(obj_count, args):
+    # Run all benchmarks on a course of the given number of objects and return their results.
+    root = make_course(obj_count, args.paths, args.points, args.rails, args.strings, args.seed)
+    data = encode(root)
+    if encode(_decode(data).root) != data:
+        raise AssertionError("Round-trip of the generated course does not reproduce its data.")
+    # Lazy sections copied into a plain tree are written like decoded ones, also by worker processes.
+    mixed_root = dict(_decode(data, lazy=True).root)
+    if encode(mixed_root) != data or encode(mixed_root, processes=2) != data:
+        raise AssertionError("Round-trip of lazy sections in a plain tree does not reproduce their data.")
+
+    def save_raw(**kwargs):
+        file = byaml.File()
+        file.root = root
+        file.save_raw(_Sink(), **kwargs)
+
+    def round_trip():
+        file = _decode(data)
+        file.save_raw(_Sink())
+
+    def decode_cached():
+        byaml.cache = cache
+        try:
+            _decode(data)
+        finally:
+            byaml.cache = None
+
+    # Fill the cache with the tree first, so that all timed runs take it from there.
+    cache_directory = tempfile.TemporaryDirectory()
+    cache = byaml.Cache(cache_directory.name)
+    decode_cached()
+
+    benchmarks = [
+        ("decode", lambda: _decode(data)),
+        ("decode_lazy_materialize", lambda: _decode(data, lazy=True).materialize()),
+        ("encode", lambda: save_raw()),
+        ("encode_deduplicated", lambda: save_raw(deduplicate=True)),
+        ("decode_cached", decode_cached),
+        ("round_trip", round_trip),
+        ("decode_digest", lambda: byaml.get_digest(_decode(data).root))
+    ]
+    if args.processes != 1:
+        benchmarks.append(("encode_parallel", lambda: save_raw(processes=args.processes)))
+    # Measure the raw binary_io throughput on the same amount of data.
+    words = numpy.arange(len(data) // 4, dtype=numpy.uint32)
+    benchmarks.append(("binary_io_read_uint32s", lambda: _read_uint32s(data)))
+    benchmarks.append(("binary_io_write_uint32s", lambda: _write_uint32s(words)))
+
+    results = []
+    for name, function in benchmarks:
+        if args.only and name not in args.only:
+            continue
+        times, peak = measure(function, args.repeat)
+        best = min(times)
+        results.append({
+            "benchmark": name,
+            "objs": obj_count,
+            "paths": args.paths,
+            "points": args.points,
+            "rails": args.rails,
+            "strings": args.strings,
+            "bytes": len(data),
+            "times": times,
+            "best": best,
+            "median": sorted(times)[len(times) // 2],
+            "throughput_mb_s": len(data) / best / 1e6 if best else None,
+            "peak_memory_bytes": peak
+        })
+        print("{:>8} objs  {:<26} {:>9.4f} s  {:>8.1f} MB/s  {:>8.1f} MB peak".format(
+            obj_count, name, best, results[-1]["throughput_mb_s"] or 0, peak / 1e6))
+    cache_directory.cleanup()
+    return results
+
+
+def _decode(data, **kwargs):
+    file = byaml.File()
+    file.load_raw(data, **kwargs)
+    return file
+
+
+def _read_uint32s(data):
+    with binary_io.MemoryReader(data) as reader:
+        reader.endianness = ">"
+        reader.read_uint32_array_at(0, len(data) // 4)
+
+
+def _write_uint32s(words):
+    with binary_io.StreamWriter(_Sink()) as writer:
+        writer.endianness = ">"
+        writer.write_uint32s(words)
+
+
+# ---- Reporting ----
+
+def get_environment():
+    # Describe the revision and interpreter the results were measured with.
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=_src_path, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def compare(results, baseline_path):
+    # Print the change of the best times relative to the results of another run.
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    previous = {(r["benchmark"], r["objs"]): r for r in baseline["results"]}
+    print("Compared to {}:".format(baseline["environment"].get("revision") or baseline_path))
+    for result in results:
+        old = previous.get((result["benchmark"], result["objs"]))
+        if old:
+            change = (result["best"] / old["best"] - 1) * 100 if old["best"] else 0
+            print("{:>8} objs  {:<26} {:>9.4f} s -> {:>9.4f} s  {:+7.1f} %".format(
+                result["objs"], result["benchmark"], old["best"], result["best"], change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark BYAML decoding and encoding on synthetic courses.")
+    parser.add_argument("--objs", default="1000,10000", help="comma-separated numbers of Obj entries to test")
+    parser.add_argument("--paths", type=int, default=64, help="number of paths with path points")
+    parser.add_argument("--points", type=int, default=32, help="number of points per path and rail")
+    parser.add_argument("--rails", type=int, default=16, help="number of BYAML paths")
+    parser.add_argument("--strings", type=int, default=1000, help="number of strings in the string table")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated courses")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs per benchmark")
+    parser.add_argument("--processes", type=int, default=1, help="also encode with this many processes, 0 for all")
+    parser.add_argument("--only", nargs="*", help="names of the benchmarks to run")
+    parser.add_argument("--output", help="path of the JSON file to write the results to")
+    parser.add_argument("--compare", help="path of a JSON file of earlier results to compare to")
+    args = parser.parse_args(argv)
+    if args.processes == 0:
+        args.processes = None
+
+    results = []
+    for obj_count in (int(count) for count in args.objs.split(",")):
+        results += run_scale(obj_count, args)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"environment": get_environment(), "results": results}, file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
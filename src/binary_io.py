@@ -1,5 +1,99 @@
+import array
 import io
+import mmap
+import os
 import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Codec:
+    # Precompiled structs for one endianness, shared by all readers and writers using it.
+    _codecs = {}
+    _max_cached_count = 64  # Plural structs of larger counts are compiled on demand to keep the cache small.
+    # Array type codes of the struct formats, as array.array does not guarantee the sizes of its integer types.
+    _array_types = {
+        "b": "b",
+        "B": "B",
+        "H": "H",
+        "f": "f",
+        "i": "i" if array.array("i").itemsize == 4 else "l",
+        "I": "I" if array.array("I").itemsize == 4 else "L"
+    }
+
+    def __init__(self, endianness):
+        self.endianness = endianness
+        self.swap = (endianness in ">!") == (sys.byteorder == "little") and endianness not in "=@"
+        self._structs = {}
+        self.byte = self.get("B")
+        self.int32 = self.get("i")
+        self.sbyte = self.get("b")
+        self.single = self.get("f")
+        self.uint16 = self.get("H")
+        self.uint32 = self.get("I")
+
+    @staticmethod
+    def array_type(format):
+        return Codec._array_types[format]
+
+    @staticmethod
+    def of(endianness):
+        codec = Codec._codecs.get(endianness)
+        if not codec:
+            codec = Codec(endianness)
+            Codec._codecs[endianness] = codec
+        return codec
+
+    def get(self, format):
+        # Returns the compiled struct for the format, which is prefixed with the endianness of this codec.
+        compiled = self._structs.get(format)
+        if not compiled:
+            compiled = struct.Struct(self.endianness + format)
+            self._structs[format] = compiled
+        return compiled
+
+    def compile(self, format):
+        # Returns the compiled struct for the format, caching only short formats to keep the cache small.
+        if len(format) > Codec._max_cached_count:
+            return struct.Struct(self.endianness + format)
+        return self.get(format)
+
+    def plural(self, format, count):
+        if count > Codec._max_cached_count:
+            return struct.Struct(self.endianness + str(int(count)) + format)
+        return self.get(str(int(count)) + format)
+
+    def to_array(self, format, data):
+        # Creates an array.array of native values from the raw data.
+        value = array.array(Codec._array_types[format])
+        value.frombytes(data)
+        if self.swap:
+            value.byteswap()
+        return value
+
+    def to_ndarray(self, format, data, offset=0, count=-1):
+        # Creates a NumPy array viewing the raw data without copying it.
+        if not numpy:
+            raise ImportError("NumPy is required to read NumPy arrays.")
+        return numpy.frombuffer(data, self.endianness + format, count, offset)
+
+    def pack_array(self, format, value):
+        # Returns the raw data of an array.array or NumPy array, or None if the value is not such an array.
+        if isinstance(value, array.array):
+            if value.typecode != Codec._array_types[format]:
+                value = array.array(Codec._array_types[format], value)
+            elif self.swap:
+                value = array.array(value.typecode, value)
+            if self.swap:
+                value.byteswap()
+            return value.tobytes()
+        if numpy and isinstance(value, numpy.ndarray):
+            return value.astype(self.endianness + format, copy=False).tobytes()
+        return None
 
 
 class BinaryReader:
@@ -14,6 +108,14 @@ class BinaryReader:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.reader.close()
 
+    @property
+    def endianness(self):
+        return self.codec.endianness
+
+    @endianness.setter
+    def endianness(self, value):
+        self.codec = Codec.of(value)
+
     def align(self, alignment):
         self.reader.seek(-self.reader.tell() % alignment, io.SEEK_CUR)
 
@@ -24,12 +126,12 @@ class BinaryReader:
         return self.reader.tell()
 
     def read_0_string(self):
-        text = ""
+        text = bytearray()
         i = self.read_byte()
         while i != 0:
-            text += chr(i)
+            text.append(i)
             i = self.read_byte()
-        return text
+        return text.decode("latin-1")
 
     def read_byte(self):
         return self.reader.read(1)[0]
@@ -38,38 +140,260 @@ class BinaryReader:
         return self.reader.read(count)
 
     def read_int32(self):
-        return struct.unpack(self.endianness + "i", self.reader.read(4))[0]
+        return self.codec.int32.unpack(self.reader.read(4))[0]
 
     def read_int32s(self, count):
-        return struct.unpack(self.endianness + str(int(count)) + "i", self.reader.read(4 * count))
+        return self.codec.plural("i", count).unpack(self.reader.read(4 * count))
 
     def read_sbyte(self):
-        return struct.unpack(self.endianness + "b", self.reader.read(1))[0]
+        return self.codec.sbyte.unpack(self.reader.read(1))[0]
 
     def read_sbytes(self, count):
-        return struct.unpack(self.endianness + str(int(count)) + "b", self.reader.read(1 * count))
+        return self.codec.plural("b", count).unpack(self.reader.read(1 * count))
 
     def read_single(self):
-        return struct.unpack(self.endianness + "f", self.reader.read(4))[0]
+        return self.codec.single.unpack(self.reader.read(4))[0]
 
     def read_singles(self, count):
-        return struct.unpack(self.endianness + str(int(count)) + "f", self.reader.read(4 * count))
+        return self.codec.plural("f", count).unpack(self.reader.read(4 * count))
+
+    def read_single_array(self, count, ndarray=False):
+        return self._read_array("f", 4, count, ndarray)
+
+    def read_structs(self, format, count):
+        # Reads count records of the given struct format in one call, returning a tuple for each.
+        compiled = self.codec.get(format)
+        return list(compiled.iter_unpack(self.reader.read(compiled.size * count)))
 
     def read_uint16(self):
-        return struct.unpack(self.endianness + "H", self.reader.read(2))[0]
+        return self.codec.uint16.unpack(self.reader.read(2))[0]
 
     def read_uint16s(self, count):
-        return struct.unpack(self.endianness + str(int(count)) + "H", self.reader.read(2 * count))
+        return self.codec.plural("H", count).unpack(self.reader.read(2 * count))
 
     def read_uint32(self):
-        return struct.unpack(self.endianness + "I", self.reader.read(4))[0]
+        return self.codec.uint32.unpack(self.reader.read(4))[0]
 
     def read_uint32s(self, count):
-        return struct.unpack(self.endianness + str(int(count)) + "I", self.reader.read(4 * count))
+        return self.codec.plural("I", count).unpack(self.reader.read(4 * count))
+
+    def read_uint32_array(self, count, ndarray=False):
+        return self._read_array("I", 4, count, ndarray)
 
     def read_raw_string(self, length, encoding="ascii"):
         return self.reader.read(length).decode(encoding)
 
+    def _read_array(self, format, size, count, ndarray):
+        data = self.reader.read(size * count)
+        return self.codec.to_ndarray(format, data) if ndarray else self.codec.to_array(format, data)
+
+
+class MemoryReader:
+    def __init__(self, raw):
+        self.raw = raw
+        self.endianness = "<"  # Little-endian
+        self.buffer = None
+        self.position = 0
+        self._mmap = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        if isinstance(self.raw, (bytes, bytearray, mmap.mmap)):
+            # Read directly from the given buffer.
+            self.buffer = self.raw
+        elif isinstance(self.raw, io.BytesIO):
+            # Get the contents of the in-memory stream, which does not copy them as long as they are not modified.
+            self.buffer = self.raw.getvalue()
+        elif isinstance(self.raw, (str, os.PathLike)):
+            # Map the file at the given path into memory, the map stays valid after closing the file.
+            with open(self.raw, "rb") as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buffer = self._mmap
+        else:
+            # Map the file behind the stream into memory.
+            self._mmap = mmap.mmap(self.raw.fileno(), 0, access=mmap.ACCESS_READ)
+            self.buffer = self._mmap
+        self.position = 0
+        return self
+
+    def close(self):
+        # Arrays returned by this reader are copies of mapped data, but a map still viewed by other objects cannot be
+        # closed before they are released, which happens once they are garbage collected.
+        self.buffer = None
+        if self._mmap:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+        # Close streams like the stream based reader does.
+        if isinstance(self.raw, io.IOBase):
+            self.raw.close()
+
+    @property
+    def endianness(self):
+        return self.codec.endianness
+
+    @endianness.setter
+    def endianness(self, value):
+        self.codec = Codec.of(value)
+
+    @staticmethod
+    def supports(raw):
+        # Returns whether the raw data can be read from memory or mapped into it, which requires a seekable file of
+        # which the stream returns the contents as is, unlike e.g. streams decompressing a file.
+        if isinstance(raw, (bytes, bytearray, mmap.mmap, io.BytesIO, str, os.PathLike)):
+            return True
+        if isinstance(raw, io.BufferedReader):
+            raw = raw.raw
+        return isinstance(raw, io.FileIO) and raw.seekable()
+
+    def align(self, alignment):
+        self.position += -self.position % alignment
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = len(self.buffer) + offset
+
+    def tell(self):
+        return self.position
+
+    def cursor(self, position=None):
+        # Returns an independent reader on the same buffer, starting at the given or the current position.
+        cursor = MemoryReader(self.buffer)
+        cursor.buffer = self.buffer
+        cursor.codec = self.codec
+        cursor.position = self.position if position is None else position
+        return cursor
+
+    def read_0_string(self):
+        text = self.read_0_string_at(self.position)
+        self.position += len(text) + 1
+        return text
+
+    def read_0_string_at(self, offset):
+        end = self.buffer.find(b"\0", offset)
+        if end == -1:
+            raise EOFError("Unterminated 0-string at " + str(offset) + ".")
+        return self.buffer[offset:end].decode("latin-1")
+
+    def read_byte(self):
+        self.position += 1
+        return self.buffer[self.position - 1]
+
+    def read_byte_at(self, offset):
+        return self.buffer[offset]
+
+    def read_bytes(self, count):
+        self.position += count
+        return self.buffer[self.position - count:self.position]
+
+    def read_bytes_at(self, offset, count):
+        return self.buffer[offset:offset + count]
+
+    def read_format_at(self, offset, format):
+        # Decodes all values of an arbitrary struct format in one call.
+        return self.codec.compile(format).unpack_from(self.buffer, offset)
+
+    def read_struct_at(self, offset, compiled):
+        # Decodes all values of a struct compiled with the endianness of this reader in one call.
+        return compiled.unpack_from(self.buffer, offset)
+
+    def read_int32(self):
+        return self._unpack(self.codec.int32)[0]
+
+    def read_int32_at(self, offset):
+        return self.codec.int32.unpack_from(self.buffer, offset)[0]
+
+    def read_int32s(self, count):
+        return self._unpack(self.codec.plural("i", count))
+
+    def read_sbyte(self):
+        return self._unpack(self.codec.sbyte)[0]
+
+    def read_sbytes(self, count):
+        return self._unpack(self.codec.plural("b", count))
+
+    def read_single(self):
+        return self._unpack(self.codec.single)[0]
+
+    def read_single_at(self, offset):
+        return self.codec.single.unpack_from(self.buffer, offset)[0]
+
+    def read_singles(self, count):
+        return self._unpack(self.codec.plural("f", count))
+
+    def read_single_array(self, count, ndarray=False):
+        value = self.read_single_array_at(self.position, count, ndarray)
+        self.position += 4 * count
+        return value
+
+    def read_single_array_at(self, offset, count, ndarray=False):
+        return self._read_array_at(offset, "f", 4, count, ndarray)
+
+    def read_structs(self, format, count):
+        value = self.read_structs_at(self.position, format, count)
+        self.position += self.codec.get(format).size * count
+        return value
+
+    def read_structs_at(self, offset, format, count):
+        # Reads count records of the given struct format in one call, returning a tuple for each.
+        compiled = self.codec.get(format)
+        with memoryview(self.buffer) as view:
+            return list(compiled.iter_unpack(view[offset:offset + compiled.size * count]))
+
+    def read_uint16(self):
+        return self._unpack(self.codec.uint16)[0]
+
+    def read_uint16_at(self, offset):
+        return self.codec.uint16.unpack_from(self.buffer, offset)[0]
+
+    def read_uint16s(self, count):
+        return self._unpack(self.codec.plural("H", count))
+
+    def read_uint32(self):
+        return self._unpack(self.codec.uint32)[0]
+
+    def read_uint32_at(self, offset):
+        return self.codec.uint32.unpack_from(self.buffer, offset)[0]
+
+    def read_uint32s(self, count):
+        return self._unpack(self.codec.plural("I", count))
+
+    def read_uint32_array(self, count, ndarray=False):
+        value = self.read_uint32_array_at(self.position, count, ndarray)
+        self.position += 4 * count
+        return value
+
+    def read_uint32_array_at(self, offset, count, ndarray=False):
+        return self._read_array_at(offset, "I", 4, count, ndarray)
+
+    def read_raw_string(self, length, encoding="ascii"):
+        return self.read_bytes(length).decode(encoding)
+
+    def _read_array_at(self, offset, format, size, count, ndarray):
+        if ndarray:
+            # View the buffer directly, the array is only valid as long as the buffer is. Mapped files are copied
+            # instead, as the map cannot be closed while it is viewed.
+            value = self.codec.to_ndarray(format, self.buffer, offset, count)
+            return value.copy() if self._mmap else value
+        return self.codec.to_array(format, self.buffer[offset:offset + size * count])
+
+    def _unpack(self, compiled):
+        # Decode at the absolute position in the buffer rather than slicing a copy out of it first.
+        value = compiled.unpack_from(self.buffer, self.position)
+        self.position += compiled.size
+        return value
+
 
 class BinaryWriter:
     def __init__(self, raw):
@@ -78,14 +402,37 @@ class BinaryWriter:
 
     def __enter__(self):
         self.writer = io.BufferedWriter(self.raw)
+        self._relocation_positions = array.array(Codec.array_type("I"))
+        self._relocation_values = array.array(Codec.array_type("I"))
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        # Write all satisfied offsets in one pass.
+        for position, value in zip(self._relocation_positions, self._relocation_values):
+            self.writer.seek(position)
+            self.writer.write(self.codec.uint32.pack(value))
         self.writer.close()
 
+    @property
+    def endianness(self):
+        return self.codec.endianness
+
+    @endianness.setter
+    def endianness(self, value):
+        self.codec = Codec.of(value)
+
     def align(self, alignment):
         self.writer.seek(-self.writer.tell() % alignment, io.SEEK_CUR)
 
+    @property
+    def relocation_count(self):
+        return len(self._relocation_positions)
+
+    def relocate(self, position, value):
+        # Remember to write the uint32 value at the position when the writer is closed.
+        self._relocation_positions.append(position)
+        self._relocation_values.append(value)
+
     def reserve_offset(self):
         return Offset(self)
 
@@ -103,44 +450,255 @@ class BinaryWriter:
         self.write_byte(0)
 
     def write_byte(self, value):
-        self.writer.write(struct.pack("B", value))
+        self.writer.write(self.codec.byte.pack(value))
 
     def write_bytes(self, value):
         self.writer.write(value)
 
     def write_int32(self, value):
-        self.writer.write(struct.pack(self.endianness + "i", value))
+        self.writer.write(self.codec.int32.pack(value))
 
     def write_int32s(self, value):
-        self.writer.write(struct.pack(self.endianness + str(len(value)) + "i", *value))
+        self._write_plural("i", value)
 
     def write_sbyte(self, value):
-        self.writer.write(struct.pack(self.endianness + "b", value))
+        self.writer.write(self.codec.sbyte.pack(value))
 
     def write_sbytes(self, value):
-        self.writer.write(struct.pack(self.endianness + str(len(value)) + "b", *value))
+        self._write_plural("b", value)
 
     def write_single(self, value):
-        self.writer.write(struct.pack(self.endianness + "f", value))
+        self.writer.write(self.codec.single.pack(value))
 
     def write_singles(self, value):
-        self.writer.write(struct.pack(self.endianness + str(len(value)) + "f", *value))
+        self._write_plural("f", value)
+
+    def write_structs(self, format, value):
+        # Writes the tuples as records of the given struct format.
+        compiled = self.codec.get(format)
+        self.writer.write(b"".join(compiled.pack(*record) for record in value))
 
     def write_uint16(self, value):
-        self.writer.write(struct.pack(self.endianness + "H", value))
+        self.writer.write(self.codec.uint16.pack(value))
 
     def write_uint16s(self, value):
-        self.writer.write(struct.pack(self.endianness + str(len(value)) + "H", *value))
+        self._write_plural("H", value)
 
     def write_uint32(self, value):
-        self.writer.write(struct.pack(self.endianness + "I", value))
+        self.writer.write(self.codec.uint32.pack(value))
 
     def write_uint32s(self, value):
-        self.writer.write(struct.pack(self.endianness + str(len(value)) + "I", *value))
+        self._write_plural("I", value)
 
     def write_raw_string(self, value, encoding="ascii"):
         self.writer.write(bytearray(value, encoding))
 
+    def _write_plural(self, format, value):
+        # Write arrays in bulk, and pack any other sequence with a struct of the sequence length.
+        data = self.codec.pack_array(format, value)
+        if data is None:
+            data = self.codec.plural(format, len(value)).pack(*value)
+        self.writer.write(data)
+
+
+class MemoryWriter:
+    def __init__(self, raw):
+        self.raw = raw
+        self.endianness = "<"  # Little-endian
+        self.buffer = None
+        self.position = 0
+
+    def __enter__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        self._relocation_positions = array.array(Codec.array_type("I"))
+        self._relocation_values = array.array(Codec.array_type("I"))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # Patch all satisfied offsets in one pass.
+        for position, value in zip(self._relocation_positions, self._relocation_values):
+            self.codec.uint32.pack_into(self.buffer, position, value)
+        # Write the whole buffer to the stream or file path in one call.
+        if isinstance(self.raw, (str, os.PathLike)):
+            with open(self.raw, "wb") as file:
+                file.write(self.buffer)
+        else:
+            with memoryview(self.buffer) as data:
+                while data:
+                    data = data[self.raw.write(data):]
+            self.raw.close()
+        self.buffer = None
+
+    @property
+    def endianness(self):
+        return self.codec.endianness
+
+    @endianness.setter
+    def endianness(self, value):
+        self.codec = Codec.of(value)
+
+    def align(self, alignment):
+        self.position += -self.position % alignment
+
+    @property
+    def relocation_count(self):
+        return len(self._relocation_positions)
+
+    def relocate(self, position, value):
+        # Remember to write the uint32 value at the position when the writer is closed.
+        self._relocation_positions.append(position)
+        self._relocation_values.append(value)
+
+    def reserve_offset(self):
+        return Offset(self)
+
+    def satisfy_offset(self, offset, value=None):
+        offset.satisfy(self, value)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = len(self.buffer) + offset
+
+    def tell(self):
+        return self.position
+
+    def write_0_string(self, value, encoding="ascii"):
+        self._write(value.encode(encoding) + b"\0")
+
+    def write_byte(self, value):
+        self._pack(self.codec.byte, value)
+
+    def write_bytes(self, value):
+        self._write(value)
+
+    def write_int32(self, value):
+        self._pack(self.codec.int32, value)
+
+    def write_int32s(self, value):
+        self._write_plural("i", value)
+
+    def write_sbyte(self, value):
+        self._pack(self.codec.sbyte, value)
+
+    def write_sbytes(self, value):
+        self._write_plural("b", value)
+
+    def write_single(self, value):
+        self._pack(self.codec.single, value)
+
+    def write_singles(self, value):
+        self._write_plural("f", value)
+
+    def write_structs(self, format, value):
+        # Writes the tuples as records of the given struct format.
+        compiled = self.codec.get(format)
+        self._write(b"".join(compiled.pack(*record) for record in value))
+
+    def write_uint16(self, value):
+        self._pack(self.codec.uint16, value)
+
+    def write_uint16s(self, value):
+        self._write_plural("H", value)
+
+    def write_uint32(self, value):
+        self._pack(self.codec.uint32, value)
+
+    def write_uint32s(self, value):
+        self._write_plural("I", value)
+
+    def write_raw_string(self, value, encoding="ascii"):
+        self._write(value.encode(encoding))
+
+    def _pack(self, compiled, *values):
+        if self.position == len(self.buffer):
+            self.buffer += compiled.pack(*values)
+        else:
+            # Patch the value in place when writing over or behind existing data.
+            self._grow(compiled.size)
+            compiled.pack_into(self.buffer, self.position, *values)
+        self.position += compiled.size
+
+    def _write(self, data):
+        if self.position == len(self.buffer):
+            self.buffer += data
+        else:
+            self._grow(len(data))
+            self.buffer[self.position:self.position + len(data)] = data
+        self.position += len(data)
+
+    def _write_plural(self, format, value):
+        data = self.codec.pack_array(format, value)
+        if data is None:
+            data = self.codec.plural(format, len(value)).pack(*value)
+        self._write(data)
+
+    def _grow(self, size):
+        # Pad the buffer with zeros if the data is written behind its end, like seeking past the end of a file.
+        if len(self.buffer) < self.position + size:
+            self.buffer.extend(bytes(self.position + size - len(self.buffer)))
+
+
+class StreamWriter(MemoryWriter):
+    # Writes data strictly sequentially, handing it to the stream in chunks, so that it can also write to streams which
+    # cannot seek like pipes, sockets or compressors. Offsets must be known before they are written, as it cannot seek
+    # back to patch them.
+    _chunk_size = 0x10000
+
+    def __enter__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        if isinstance(self.raw, (str, os.PathLike)):
+            self.raw = open(self.raw, "wb")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if not exc_type:
+                self._flush()
+        finally:
+            self.raw.close()
+            self.buffer = None
+
+    def align(self, alignment):
+        self._write(bytes(-self.position % alignment))
+
+    @property
+    def relocation_count(self):
+        return 0
+
+    def relocate(self, position, value):
+        raise io.UnsupportedOperation("Cannot relocate offsets in sequentially written data.")
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence != io.SEEK_CUR or offset:
+            raise io.UnsupportedOperation("Cannot seek in sequentially written data.")
+
+    def _pack(self, compiled, *values):
+        self.buffer += compiled.pack(*values)
+        self.position += compiled.size
+        if len(self.buffer) >= StreamWriter._chunk_size:
+            self._flush()
+
+    def _write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        if len(self.buffer) >= StreamWriter._chunk_size:
+            self._flush()
+
+    def _flush(self):
+        # Hand the buffered chunk to the stream, which may accept only part of it per call.
+        written = 0
+        with memoryview(self.buffer) as data:
+            while written < len(data):
+                with data[written:] as chunk:
+                    written += self.raw.write(chunk)
+        self.buffer.clear()
+
 
 class Offset:
     def __init__(self, writer):
@@ -152,8 +710,5 @@ class Offset:
 
     def satisfy(self, writer, value=None):
         self.value = value if value else writer.tell()
-        # Seek back temporarily to the offset position to write the final offset value.
-        current_position = writer.tell()
-        writer.seek(self.position)
-        writer.write_uint32(self.value)
-        writer.seek(current_position)
+        # Record the final offset value, the writer writes it to the offset position once it is closed.
+        writer.relocate(self.position, self.value)
@@ -1,329 +1,1754 @@
+import collections.abc
+import concurrent.futures
 import enum
-import io
-import mathutils
-from . import binary_io
+import gc
+import hashlib
+import numpy
+import os
+import pickle
+import re
+import struct
+import sys
+import time
+import weakref
+try:
+    from . import binary_io
+except ImportError:
+    import binary_io  # Imported as a top-level module outside of Blender, e.g. by tools in a plain Python process.
+
+cache = None  # The Cache which File.load_raw() takes decoded trees from and stores them in, if any.
 
 
 class File:
-    def __init__(self):
+    def __init__(self, instrument=False):
         self._name_array = None
         self._string_array = None
         self._path_array = None
+        self._name_indices = None
+        self._string_indices = None
+        self._path_indices = None
+        self._lazy_load = None
+        self._nodes = None
+        self._copy_shared = False
         self.root = None
+        self.deduplicated_bytes = 0
+        self.shared_nodes = 0
+        self.stats = None  # Statistics of the last load and save if instrumented, s. _create_stats().
+        self._sections = None
+        # Readers of complex nodes and converters of simple values, indexed by the node type byte.
+        self._node_readers = [None] * 256
+        self._node_readers[NodeType.Array] = self._read_array
+        self._node_readers[NodeType.Dictionary] = self._read_dictionary
+        self._node_readers[NodeType.StringArray] = self._read_string_array
+        self._node_readers[NodeType.PathArray] = self._read_path_array
+        self._value_converters = [None] * 256  # Integers and floats are decoded as is.
+        self._value_converters[NodeType.StringIndex] = self._read_string_index
+        self._value_converters[NodeType.PathIndex] = self._read_path_index
+        self._value_converters[NodeType.Boolean] = self._read_boolean
+        for node_type in range(NodeType.Array, NodeType.PathArray + 1):
+            self._value_converters[node_type] = _undecoded  # Offsets to complex nodes read later.
+        # Decoding prepared for arrays and dictionaries with the same element types and names.
+        self._value_structs = {}
+        self._dictionary_shapes = {}
+        # Measure nodes only if requested, by replacing the readers with ones measuring them.
+        if instrument:
+            self.stats = {}
+            for node_type in range(NodeType.Array, NodeType.PathArray + 1):
+                self._node_readers[node_type] = self._instrument_reader(node_type, self._node_readers[node_type])
 
-    def load_raw(self, raw):
-        # Open a big-endian binary reader on the stream.
-        with binary_io.BinaryReader(raw) as reader:
-            reader.endianness = ">"
-            header = Header.load(reader)
-            # Read the name array, holding strings referenced by index for the names of other nodes.
-            reader.seek(header.name_array_offset)
-            self._name_array = self._read_node(reader)
-            # Read the optional string array, holding strings referenced by index in string nodes.
-            if header.string_array_offset:
-                reader.seek(header.string_array_offset)
-                self._string_array = self._read_node(reader)
-            # Read the optional path array, holding paths referenced by index in path nodes.
-            if header.path_array_offset:
-                reader.seek(header.path_array_offset)
-                self._path_array = self._read_node(reader)
-            # Read the root node.
-            reader.seek(header.root_offset)
-            self.root = self._read_node(reader)
+    def get_digest(self, path=()):
+        # Returns the digest of the node at the path of dictionary keys and array indices below the root.
+        node = self.root
+        for key in path:
+            node = node[key]
+        return get_digest(node)
 
-    def save_raw(self, raw):
-        # Prepare the node name, string and path arrays.
-        names = []
-        strings = []
+    def load_raw(self, raw, lazy=False, copy_shared=False):
+        if self.stats is not None:
+            start = time.perf_counter()
+            self.stats["decode"] = _create_stats()
+        self._lazy_load = None  # Proxies of a previous lazy load keep its data on their own.
+        reader, header = self._open(raw, copy_shared)
+        try:
+            # Take the tree from the cache if the same data was decoded before. Lazy loads are cheap already, and
+            # instrumented loads measure the decoding.
+            key = None
+            entry = None
+            if cache and not lazy and self.stats is None:
+                key = cache.get_key(reader.buffer, copy_shared)
+                entry = cache.load(key)
+            # Read the root node, or only create a proxy for it which decodes its elements when they are accessed.
+            if entry:
+                self.root, self.shared_nodes = entry
+            elif lazy:
+                self._lazy_load = _LazyLoad(self, reader)
+                self.root = self._lazy_load.read_root(header.root_offset)
+            else:
+                self.root = self._read_node(reader, header.root_offset)
+                if key:
+                    cache.save(key, self.root, self.shared_nodes)
+        finally:
+            # Lazy nodes require the data to stay available until the file is materialized, and decode with the nodes
+            # kept by their load.
+            if lazy:
+                self._release_nodes()
+            else:
+                self._close(reader)
+        if self.stats is not None:
+            self.stats["decode"]["seconds"] = time.perf_counter() - start
+
+    def load_section(self, file_path, key, element=None, index=None):
+        # Returns the top-level section of the file with the given key, or the element of it if it is an array, decoding
+        # only it by jumping to it with the offsets in the given or the sidecar index of the file, s. get_index().
+        if index is None:
+            index = get_index(file_path)
+        if element is None:
+            node_type, offset = index.sections[key][:2]
+        else:
+            node_type, offset = index.elements[key][element][:2]
+        reader, header = self._open(file_path, index=index)
+        try:
+            if NodeType.Array <= node_type <= NodeType.PathArray:
+                return self._read_node(reader, offset)
+            return self._read_value(reader, node_type, offset)
+        finally:
+            self._close(reader)
+
+    def materialize(self):
+        # Decode all remaining lazy nodes into dictionaries and lists and release the data they were decoded from.
+        self.root = _materialize(self.root)
+        self._lazy_load = None
+
+    def query(self, selector, paths=False):
+        # Returns the values below the root matching the selector, s. query().
+        return query(self.root, selector, paths)
+
+    def save_raw(self, raw, deduplicate=False, processes=1):
+        stats = None
+        if self.stats is not None:
+            start = time.perf_counter()
+            stats = self.stats["encode"] = _create_stats()
+        # Plan the contents of all arrays and dictionaries first, classifying and sorting their elements only once.
+        root = _materialize(self.root)
+        if not isinstance(root, (list, dict)):
+            raise TypeError("Expected complex value type, not " + type(root).__name__)
+        names = set()
+        strings = set()
         paths = []
-        self._prepare_export(self.root, names, strings, paths)
-        names = list(set(names))
-        strings = list(set(strings))
-        names.sort()
-        strings.sort()
-        self._name_array = StringArray(names)
-        self._string_array = StringArray(strings)
-        self._path_array = PathArray(paths)
+        layouts = []
+        # With more than one process (or None for all cores), the sections of the root are planned here, but the
+        # arrays and dictionaries in them are planned and encoded in parallel, split into runs of consecutive elements.
+        # Deduplication needs to know all nodes written before, and instrumentation measures each node, so they are
+        # always done serially.
+        if processes == 1 or deduplicate or stats is not None:
+            self._plan_node(layouts, root, names, strings, paths)
+        else:
+            self._plan_node(layouts, root, names, strings, paths, 2, 4 * (processes or os.cpu_count()))
+            sections = [layout for layout in layouts if isinstance(layout, _SectionLayout)]
+            if sections:
+                self._encode_sections(sections, processes)
+                for section in sections:
+                    names.update(section.encoded.names)
+                    strings.update(section.encoded.strings)
+                paths = []
+                self._collect_paths(layouts[0], paths)
+        if stats is not None:
+            stats["plan_seconds"] = time.perf_counter() - start
+        # Prepare the node name, string and path arrays.
+        self._name_array = StringArray._from_trusted(sorted(names))
+        self._string_array = StringArray._from_trusted(sorted(strings))
+        self._index_paths(paths)
+        # Intern the names and strings to look up their indices without searching the arrays.
+        self._name_indices = {name: i for i, name in enumerate(self._name_array)}
+        self._string_indices = {string: i for i, string in enumerate(self._string_array)}
+        # Compute the offsets of all nodes up front, so that the file can be written strictly sequentially, also to
+        # streams which cannot seek.
+        codec = binary_io.Codec.of(">")
+        name_offsets = self._get_string_offsets(self._name_array)
+        string_offsets = self._get_string_offsets(self._string_array)
+        path_offsets = self._get_path_offsets(self._path_array)
+        name_array_offset = 0x14  # Directly follows the header.
+        offset = name_array_offset + name_offsets[-1]
+        string_array_offset = 0
+        if len(self._string_array):
+            offset += -offset % 4
+            string_array_offset = offset
+            offset += string_offsets[-1]
+        else:
+            offset += 4  # An empty uint32 is written instead.
+        path_array_offset = 0
+        if len(self._path_array):
+            offset += -offset % 4
+            path_array_offset = offset
+            offset += path_offsets[-1]
+        else:
+            offset += 4  # An empty uint32 is written instead.
+        if deduplicate:
+            for layout in reversed(layouts):  # Elements are planned after their parents, so hash them first.
+                layout.digest = self._get_digest(codec, layout)
+        written = self._place_nodes(layouts, offset, deduplicate)
+        for layout in written:
+            if isinstance(layout, _SectionLayout):
+                self._relocate_section(layout)
+        # Measure the nodes only if requested, by replacing the methods writing them with ones measuring them.
+        write_names = write_strings = self._write_string_array
+        write_paths = self._write_path_array
+        encode_node = self._encode_node
+        if stats is not None:
+            write_names = self._instrument_writer(stats, NodeType.StringArray, "(names)", write_names)
+            write_strings = self._instrument_writer(stats, NodeType.StringArray, "(strings)", write_strings)
+            write_paths = self._instrument_writer(stats, NodeType.PathArray, "(paths)", write_paths)
+            encode_node = self._instrument_encoder(stats, layouts)
         # Write the file.
-        with binary_io.BinaryWriter(raw) as writer:
+        with binary_io.StreamWriter(raw) as writer:
             writer.endianness = ">"
             # Write the header.
             writer.write_raw_string("BY")
             writer.write_uint16(0x0001)
-            name_array_offset = writer.reserve_offset()
-            string_array_offset = writer.reserve_offset()
-            path_array_offset = writer.reserve_offset()
-            root_offset = writer.reserve_offset()
+            writer.write_uint32(name_array_offset)
+            writer.write_uint32(string_array_offset)
+            writer.write_uint32(path_array_offset)
+            writer.write_uint32(layouts[0].offset)
             # Write the main nodes.
-            self._write_value_contents(writer, name_array_offset, self._name_array)
-            if len(self._string_array):
-                self._write_value_contents(writer, string_array_offset, self._string_array)
+            write_names(writer, self._name_array, name_offsets)
+            if string_array_offset:
+                write_strings(writer, self._string_array, string_offsets)
             else:
                 writer.write_uint32(0)
-            if len(self._path_array):
-                self._write_value_contents(writer, path_array_offset, self._path_array)
+            if path_array_offset:
+                write_paths(writer, self._path_array, path_offsets)
             else:
                 writer.write_uint32(0)
-            self._write_value_contents(writer, root_offset, self.root)
+            # Write the arrays and dictionaries in the order of their offsets.
+            for layout in written:
+                writer.align(4)
+                if isinstance(layout, _SectionLayout):
+                    writer.write_bytes(layout.encoded.data)
+                else:
+                    writer.write_bytes(encode_node(codec, layout))
+        if stats is not None:
+            stats["seconds"] = time.perf_counter() - start
 
     # ---- Read ----
 
-    def _read_node(self, reader, node_type=None):
-        # Read the node type if it has not been provided yet.
-        node_type_given = bool(node_type)
-        if not node_type_given:
-            node_type = reader.read_byte()
-        if NodeType.Array <= node_type <= NodeType.PathArray:
-            # Get the length of arrays.
-            old_pos = None
-            if node_type_given:
-                # If the node type was given, the array value is read from an offset.
-                offset = reader.read_uint32()
-                old_pos = reader.tell()
-                reader.seek(offset)
-            else:
-                reader.seek(-1, io.SEEK_CUR)
-            length = reader.read_uint32() & 0x00FFFFFF
-            if node_type == NodeType.Array:
-                value = self._read_array(reader, length)
-            elif node_type == NodeType.Dictionary:
-                value = self._read_dictionary(reader, length)
-            elif node_type == NodeType.StringArray:
-                value = self._read_string_array(reader, length)
-            elif node_type == NodeType.PathArray:
-                value = self._read_path_array(reader, length)
+    def _open(self, raw, copy_shared=False, index=None):
+        # Streams which cannot be mapped into memory are read completely to decode them from memory.
+        if not binary_io.MemoryReader.supports(raw):
+            with raw:
+                raw = raw.read()
+        self._dictionary_shapes = {}  # Names differ between files.
+        # Remember complex nodes by offset to return nodes referenced multiple times as one object, or as copies of it
+        # if the caller wants to modify them independently.
+        self._nodes = {}
+        self._copy_shared = copy_shared
+        self.shared_nodes = 0
+        # Open a big-endian binary reader on the data, which nodes are read from at their absolute offsets.
+        reader = binary_io.MemoryReader(raw)
+        reader.open()
+        try:
+            reader.endianness = ">"
+            header = index.header if index else Header.load(reader.cursor(0))
+            if self.stats is not None:
+                self._sections = {
+                    header.name_array_offset: "(names)",
+                    header.string_array_offset: "(strings)",
+                    header.path_array_offset: "(paths)",
+                    header.root_offset: "(root)"
+                }
+            if index:
+                # Take the names and strings from the index rather than decoding them again.
+                self._name_array = StringArray._from_trusted(index.names)
+                self._string_array = StringArray._from_trusted(index.strings)
             else:
-                raise AssertionError("Unknown node type " + str(node_type) + ".")
-            # Seek back to the previous position if this was a value positioned at an offset.
-            if old_pos:
-                reader.seek(old_pos)
+                # Read the name array, holding strings referenced by index for the names of other nodes.
+                self._name_array = self._read_node(reader, header.name_array_offset)
+                # Read the optional string array, holding strings referenced by index in string nodes.
+                if header.string_array_offset:
+                    self._string_array = self._read_node(reader, header.string_array_offset)
+            # Read the optional path array, holding paths referenced by index in path nodes.
+            if header.path_array_offset:
+                self._path_array = self._read_node(reader, header.path_array_offset)
+        except BaseException:
+            reader.close()
+            raise
+        return reader, header
+
+    def _close(self, reader):
+        reader.close()
+        self._release_nodes()
+
+    def _release_nodes(self):
+        # Forget the nodes remembered by offset while decoding, so that they are not kept alive with the file.
+        self._nodes = None
+        self._dictionary_shapes = {}
+
+    def _read_node(self, reader, offset):
+        # Read the complex node at the offset and all nodes below it, keeping containers of which complex elements have
+        # not been read yet on a stack rather than recursing into them.
+        value, pending = self._read_complex_node(reader, offset)
+        self._nodes[offset] = value
+        stack = [(value, pending)] if pending else []
+        shared = []
+        while stack:
+            parent, pending = stack.pop()
+            # Fill in the elements without the tracking of modifications, as the digest of new nodes is not known yet.
+            set_element = dict.__setitem__ if isinstance(parent, dict) else list.__setitem__
+            for key, element_offset in pending:
+                element = self._nodes.get(element_offset)
+                if element is not None:
+                    self.shared_nodes += 1
+                    shared.append((parent, key))
+                else:
+                    element, element_pending = self._read_complex_node(reader, element_offset)
+                    self._nodes[element_offset] = element
+                    if element_pending:
+                        stack.append((element, element_pending))
+                set_element(parent, key, element)
+        # Shared nodes can only be copied once all their elements have been read.
+        if self._copy_shared:
+            for parent, key in shared:
+                parent[key] = _copy_node(parent[key])
+        return value
+
+    def _read_complex_node(self, reader, offset):
+        # Read the complex node starting with its type and length at the offset, without reading complex elements.
+        type_and_length = reader.read_uint32_at(offset)
+        node_reader = self._node_readers[type_and_length >> 24]
+        if not node_reader:
+            raise AssertionError("Unknown node type " + str(type_and_length >> 24) + ".")
+        return node_reader(reader, offset, type_and_length & 0x00FFFFFF)
+
+    def _read_value(self, reader, node_type, offset):
+        # Read the simple value of the given type at the offset.
+        value = reader.read_struct_at(offset, self._get_value_struct(reader.codec, bytes((node_type,)), None)[0])[0]
+        converter = self._value_converters[node_type]
+        return converter(value) if converter else value
+
+    def _read_lazy_node(self, reader, offset):
+        # Proxies are read-only, so they are always shared.
+        value = self._nodes.get(offset)
+        if value is not None:
+            self.shared_nodes += 1
             return value
+        value = self._create_lazy_node(reader, offset)
+        self._nodes[offset] = value
+        return value
+
+    def _create_lazy_node(self, reader, offset):
+        # Create a proxy for arrays and dictionaries, other complex nodes are decoded directly.
+        type_and_length = reader.read_uint32_at(offset)
+        node_type = type_and_length >> 24
+        length = type_and_length & 0x00FFFFFF
+        if node_type == NodeType.Array:
+            return LazyArray(self._lazy_load, offset, length)
+        elif node_type == NodeType.Dictionary:
+            return LazyDictionary(self._lazy_load, offset, length)
         else:
-            # Read the following uint32 representing the value directly.
-            if node_type == NodeType.StringIndex:
-                return self._read_string_index(reader)
-            elif node_type == NodeType.PathIndex:
-                return self._read_path_index(reader)
-            elif node_type == NodeType.Boolean:
-                return self._read_boolean(reader)
-            elif node_type == NodeType.Integer:
-                return self._read_integer(reader)
-            elif node_type == NodeType.Float:
-                return self._read_float(reader)
-            else:
+            return self._read_node(reader, offset)
+
+    def _read_lazy_value(self, reader, node_type, offset):
+        if NodeType.Array <= node_type <= NodeType.PathArray:
+            return self._read_lazy_node(reader, reader.read_uint32_at(offset))
+        else:
+            return self._read_value(reader, node_type, offset)
+
+    def _get_value_struct(self, codec, node_types, name_format):
+        # Get the struct coding the uint32s stored for the node types, each preceded by the name format in dictionaries,
+        # and whether they need to be converted. Arrays and dictionaries with the same element types are common, so
+        # they are cached.
+        key = (node_types, name_format)
+        value_struct = self._value_structs.get(key)
+        if not value_struct:
+            value_format = node_types.translate(_value_formats)
+            if 0 in value_format:
+                node_type = node_types[value_format.index(0)]
                 raise AssertionError("Unknown node type " + str(node_type) + ".")
+            value_format = value_format.decode("ascii")
+            if name_format:
+                value_format = "".join(name_format + f for f in value_format)
+            direct = not node_types.translate(None, _direct_node_types)
+            value_struct = (codec.compile(value_format), direct)
+            self._value_structs[key] = value_struct
+        return value_struct
 
-    def _read_string_index(self, reader):
-        return self._string_array[reader.read_uint32()]
+    def _convert_values(self, node_types, values, keys):
+        # Convert the decoded uint32s in place and return the keys and offsets of complex nodes which are read later.
+        pending = []
+        converters = self._value_converters
+        for i, node_type in enumerate(node_types):
+            converter = converters[node_type]
+            if converter is _undecoded:
+                pending.append((keys[i], values[i]))
+                values[i] = None
+            elif converter:
+                values[i] = converter(values[i])
+        return pending
 
-    def _read_path_index(self, reader):
-        return self._path_array[reader.read_uint32()]
+    def _read_string_index(self, value):
+        return self._string_array[value]
 
-    def _read_array(self, reader, length):
+    def _read_path_index(self, value):
+        return self._path_array[value]
+
+    def _read_array(self, reader, offset, length):
         # Read the element types of the array.
-        node_types = reader.read_bytes(length)
-        # Read the elements, which begin after a padding to the next 4 bytes.
-        reader.align(4)
-        value = []
-        for i in range(0, length):
-            value.append(self._read_node(reader, node_types[i]))
-        return value
+        node_types = reader.read_bytes_at(offset + 4, length)
+        # Read the elements in one call, which begin after a padding to the next 4 bytes.
+        offset += 4 + length
+        offset += -offset % 4
+        value_struct, direct = self._get_value_struct(reader.codec, node_types, None)
+        values = reader.read_struct_at(offset, value_struct)
+        if direct:
+            return TrackedArray(values), None
+        values = list(values)
+        pending = self._convert_values(node_types, values, range(0, length))
+        return TrackedArray(values), pending
 
-    def _read_dictionary(self, reader, length):
-        value = {}
-        # Read the elements of the dictionary.
-        for i in range(0, length):
-            idx_and_type = reader.read_uint32()
-            node_name_index = idx_and_type >> 8 & 0xFFFFFFFF
-            node_type = idx_and_type & 0x000000FF
-            node_name = self._name_array[node_name_index]
-            value[node_name] = self._read_node(reader, node_type)
-        return value
+    def _read_dictionary(self, reader, offset, length):
+        # Read the name index and type of the elements, each followed by the value.
+        name_words = reader.read_uint32_array_at(offset + 4, length * 2)[0::2]
+        # Dictionaries with the same names and types are common, so their decoding is prepared only once.
+        shape_key = name_words.tobytes()
+        shape = self._dictionary_shapes.get(shape_key)
+        if not shape:
+            node_names = [self._name_array[word >> 8] for word in name_words]
+            node_types = bytes(word & 0x000000FF for word in name_words)
+            # Skip the name index and type preceding each value.
+            shape = (node_names, node_types) + self._get_value_struct(reader.codec, node_types, "4x")
+            self._dictionary_shapes[shape_key] = shape
+        node_names, node_types, value_struct, direct = shape
+        # Read the values in one call.
+        values = list(reader.read_struct_at(offset + 4, value_struct))
+        pending = None if direct else self._convert_values(node_types, values, node_names)
+        return TrackedDictionary(zip(node_names, values)), pending
 
-    def _read_string_array(self, reader, length):
-        value = StringArray()
-        node_offset = reader.tell() - 4  # String offsets are relative to the start of this node.
-        # Read the element offsets.
-        offsets = reader.read_uint32s(length)
-        # Read the strings by seeking to their element offset and then back.
-        old_position = reader.tell()
-        for i in range(0, length):
-            reader.seek(node_offset + offsets[i])
-            value.append(reader.read_0_string())
-        reader.seek(old_position)
-        return value
+    def _read_string_array(self, reader, offset, length):
+        # Read the element offsets relative to the start of this node, where the last one points to the end of the last
+        # string.
+        offsets = reader.read_uint32_array_at(offset + 4, length + 1)
+        # Read all strings in one slice and split them at their 0-terminators.
+        data = reader.read_bytes_at(offset + offsets[0], offsets[length] - offsets[0])
+        strings = data.decode("latin-1").split("\0")
+        # Only use the split strings if each offset directly follows the previous string.
+        contiguous = len(strings) == length + 1 \
+            and all(offsets[i + 1] - offsets[i] == len(strings[i]) + 1 for i in range(0, length))
+        if not contiguous:
+            # The strings are not stored in order without gaps, read them one by one from their offsets.
+            strings = [reader.read_0_string_at(offset + offsets[i]) for i in range(0, length)]
+        # Share the strings with all other decoded files.
+        return StringArray._from_trusted(string_pool.intern(strings[:length])), None
 
-    def _read_path_array(self, reader, length):
-        value = PathArray()
-        node_offset = reader.tell() - 4  # Path offsets are relative to the start of this node.
-        # Read the element offsets.
-        offsets = reader.read_uint32s(length + 1)
-        # Read the paths by seeking to their element offset and then back.
-        old_position = reader.tell()
+    def _read_path_array(self, reader, offset, length):
+        # Read the element offsets relative to the start of this node, where the last one points to the end of the last
+        # path.
+        offsets = reader.read_uint32_array_at(offset + 4, length + 1)
+        # Decode the points of all paths in one call, and let each path view its part of them.
+        data = reader.read_bytes_at(offset + offsets[0], offsets[length] - offsets[0])
+        points = numpy.frombuffer(data, _path_point_file_dtype).astype(_path_point_dtype)
+        paths = []
         for i in range(0, length):
-            reader.seek(node_offset + offsets[i])
-            length = (offsets[i + 1] - offsets[i]) // 0x1C
-            value.append(self._read_path(reader, length))
-        reader.seek(old_position)
-        return value
+            start = (offsets[i] - offsets[0]) // _path_point_dtype.itemsize
+            end = (offsets[i + 1] - offsets[0]) // _path_point_dtype.itemsize
+            paths.append(Path(points[start:end]))
+        return PathArray._from_trusted(paths), None
 
-    def _read_path(self, reader, length):
-        value = Path()
-        for i in range(0, length):
-            value.append(self._read_path_point(reader))
-        return value
+    def _read_boolean(self, value):
+        return value != 0
 
-    def _read_path_point(self, reader):
-        value = PathPoint()
-        value.position = mathutils.Vector(reader.read_singles(3))
-        value.normal = mathutils.Vector(reader.read_singles(3))
-        value.unknown = reader.read_uint32()
-        return value
+    def _query_raw(self, raw, selector, paths):
+        # Follow the steps of the selector through the data by offsets, only decoding the nodes matched by the last.
+        reader, header = self._open(raw)
+        try:
+            name_indices = {name: i for i, name in enumerate(self._name_array)}
+            matches = [((), reader.read_byte_at(header.root_offset), header.root_offset)]
+            for step in selector.steps:
+                matches = [element for match in matches
+                           for element in self._query_elements(reader, name_indices, step, *match)]
+            values = []
+            for path, node_type, offset in matches:
+                if NodeType.Array <= node_type <= NodeType.PathArray:
+                    value = self._read_node(reader, offset)
+                else:
+                    value = self._read_value(reader, node_type, offset)
+                values.append((path, value) if paths else value)
+            return values
+        finally:
+            self._close(reader)
 
-    def _read_boolean(self, reader):
-        return reader.read_uint32() != 0
+    def _query_elements(self, reader, name_indices, step, path, node_type, offset):
+        # Yield the path, type and offset of the elements of the array or dictionary at the offset matching the step.
+        # The offset is the one of the node for complex elements, and the one of the value for simple elements.
+        length = reader.read_uint32_at(offset) & 0x00FFFFFF
+        if node_type == NodeType.Array:
+            if step is None:
+                indices = range(0, length)
+            elif isinstance(step, int) and -length <= step < length:
+                indices = (step % length,)
+            else:
+                return
+            # The elements begin after the element types and a padding to the next 4 bytes.
+            values_offset = offset + 4 + length
+            values_offset += -values_offset % 4
+            for i in indices:
+                element_type = reader.read_byte_at(offset + 4 + i)
+                yield path + (i,), element_type, self._get_element_offset(reader, element_type, values_offset + i * 4)
+        elif node_type == NodeType.Dictionary:
+            if step is None:
+                indices = range(0, length)
+            elif isinstance(step, str) and step in name_indices:
+                indices = self._find_entry(reader, offset, length, name_indices[step])
+            else:
+                return
+            for i in indices:
+                idx_and_type = reader.read_uint32_at(offset + 4 + i * 8)
+                element_type = idx_and_type & 0x000000FF
+                key = self._name_array[idx_and_type >> 8]
+                yield path + (key,), element_type, self._get_element_offset(reader, element_type, offset + 8 + i * 8)
+
+    def _find_entry(self, reader, offset, length, name_index):
+        # Binary search the entries of the dictionary, which are sorted by name, for the given name index.
+        low = 0
+        high = length
+        while low < high:
+            middle = (low + high) // 2
+            entry_index = reader.read_uint32_at(offset + 4 + middle * 8) >> 8
+            if entry_index < name_index:
+                low = middle + 1
+            elif entry_index > name_index:
+                high = middle
+            else:
+                return (middle,)
+        return ()
 
-    def _read_integer(self, reader):
-        return reader.read_int32()
+    def _get_element_offset(self, reader, node_type, offset):
+        # Complex elements store the offset to their node, other elements their value.
+        if NodeType.Array <= node_type <= NodeType.PathArray:
+            return reader.read_uint32_at(offset)
+        return offset
 
-    def _read_float(self, reader):
-        return reader.read_single()
+    def _build_index(self, file_path):
+        # Find the offsets and sizes of the sections of the root and the elements of the sections which are arrays.
+        status = os.stat(file_path)
+        reader, header = self._open(file_path)
+        try:
+            index = Index()
+            index.size = status.st_size
+            index.mtime_ns = status.st_mtime_ns
+            index.header = header
+            index.names = list(self._name_array)
+            index.strings = list(self._string_array) if header.string_array_offset else []
+            root_type = reader.read_byte_at(header.root_offset)
+            name_indices = {name: i for i, name in enumerate(index.names)}
+            sections = self._query_elements(reader, name_indices, None, (), root_type, header.root_offset)
+            for path, node_type, offset in sections:
+                index.sections[path[0]] = (node_type, offset, self._get_size(reader, node_type, offset))
+                if node_type == NodeType.Array:
+                    elements = self._query_elements(reader, name_indices, None, (), node_type, offset)
+                    index.elements[path[0]] = numpy.array(
+                        [(element_type, element_offset, self._get_size(reader, element_type, element_offset))
+                         for path, element_type, element_offset in elements], numpy.uint32).reshape(-1, 3)
+            return index
+        finally:
+            self._close(reader)
+
+    def _get_size(self, reader, node_type, offset):
+        # Returns the number of bytes from the offset of the node to the end of the last node below it, walking their
+        # offsets without decoding any values. Simple values take the 4 bytes of their slot.
+        if not NodeType.Array <= node_type <= NodeType.PathArray:
+            return 4
+        start = offset
+        end = offset
+        visited = set()
+        offsets = [offset]
+        while offsets:
+            offset = offsets.pop()
+            if offset in visited:
+                continue  # Shared with another node below.
+            visited.add(offset)
+            type_and_length = reader.read_uint32_at(offset)
+            node_type = type_and_length >> 24
+            length = type_and_length & 0x00FFFFFF
+            if node_type == NodeType.Array:
+                node_types = reader.read_bytes_at(offset + 4, length)
+                offset += 4 + length
+                offset += -offset % 4
+                values = reader.read_uint32_array_at(offset, length)
+                end = max(end, offset + 4 * length)
+                offsets.extend(values[i] for i in range(0, length)
+                               if NodeType.Array <= node_types[i] <= NodeType.PathArray)
+            elif node_type == NodeType.Dictionary:
+                words = reader.read_uint32_array_at(offset + 4, length * 2)
+                end = max(end, offset + 4 + 8 * length)
+                offsets.extend(words[i + 1] for i in range(0, length * 2, 2)
+                               if NodeType.Array <= words[i] & 0x000000FF <= NodeType.PathArray)
+            else:
+                # String and path arrays end where the last of their element offsets points to.
+                end = max(end, offset + reader.read_uint32_at(offset + 4 + 4 * length))
+        return end - start
 
     # ---- Write ----
 
-    def _prepare_export(self, value, names, strings, paths):
-        if isinstance(value, str):
-            strings.append(value)
-        elif isinstance(value, Path):
-            paths.append(value)
-        elif isinstance(value, list):
-            for val in value:
-                self._prepare_export(val, names, strings, paths)
-        elif isinstance(value, dict):
-            for key, val in sorted(value.items()):  # Dictionaries need to be sorted.
-                names.append(key)
-                self._prepare_export(val, names, strings, paths)
-
-    def _write_value(self, writer, value):
-        # Only reserve and return an offset for the complex value contents, write simple values directly.
-        if isinstance(value, str):
-            self._write_string_index(writer, value)
-        elif isinstance(value, Path):
-            self._write_path_index(writer, value)
-        elif isinstance(value, list):
-            return writer.reserve_offset()
-        elif isinstance(value, dict):
-            return writer.reserve_offset()
-        elif isinstance(value, bool):
-            self._write_boolean(writer, value)
-        elif isinstance(value, int):
-            self._write_integer(writer, value)
-        elif isinstance(value, float):
-            self._write_float(writer, value)
+    def _plan_node(self, layouts, value, names, strings, paths, depth=None, runs=1):
+        # Plan the array or dictionary and collect the names, strings and paths it uses. Its complex elements are
+        # planned after it in depth-first order, which is the order the nodes are written in. Below the given depth,
+        # they are only split into the given number of runs of consecutive elements to plan and encode separately.
+        layout = _NodeLayout()
+        layouts.append(layout)
+        if isinstance(value, (dict, LazyDictionary)):
+            items = sorted(value.items())  # Dictionaries need to be sorted.
+            layout.node_type = NodeType.Dictionary
+            layout.names = [key for key, val in items]
+            layout.elements = [val for key, val in items]
+            names.update(layout.names)
         else:
-            raise TypeError("Expected BYAML compatible value type, not " + type(value).__name__)
+            layout.node_type = NodeType.Array
+            layout.elements = value
+        node_types = bytearray()
+        section_values = []
+        for element in layout.elements:
+            node_type = _node_types_by_class.get(element.__class__) or NodeType.get_type(element)
+            node_types.append(node_type)
+            if node_type >= NodeType.Boolean:
+                continue
+            elif node_type == NodeType.StringIndex:
+                strings.add(element)
+            elif node_type == NodeType.PathIndex:
+                paths.append(element)
+            elif node_type == NodeType.Array or node_type == NodeType.Dictionary:
+                if depth is None:
+                    layout.children.append(self._plan_node(layouts, element, names, strings, paths))
+                elif depth > 1:
+                    layout.children.append(self._plan_node(layouts, element, names, strings, paths, depth - 1, runs))
+                else:
+                    section_values.append(element)
+                    layout.children.append(_NodeLayout())  # Only receives the offset and paths of the element.
+            elif node_type == NodeType.StringArray or node_type == NodeType.PathArray:
+                raise TypeError("Expected BYAML compatible value type, not " + type(element).__name__)
+        layout.node_types = bytes(node_types)
+        if section_values:
+            run_length = -(-len(section_values) // runs)
+            for start in range(0, len(section_values), run_length):
+                section = _SectionLayout()
+                section.values = section_values[start:start + run_length]
+                section.children = layout.children[start:start + run_length]
+                layouts.append(section)
+        layout.end = len(layouts)
+        return layout
 
-    def _write_value_contents(self, writer, offset, value):
-        # Satisfy the offset to the complex value which must be 4-byte aligned.
-        writer.align(4)
-        writer.satisfy_offset(offset)
-        # Write the value contents.
-        if isinstance(value, list):
-            self._write_array(writer, value)
-        elif isinstance(value, dict):
-            self._write_dictionary(writer, value)
-        elif isinstance(value, StringArray):
-            self._write_string_array(writer, value)
-        elif isinstance(value, PathArray):
-            self._write_path_array(writer, value)
+    def _get_digest(self, codec, layout):
+        # Hash the encoding of the array or dictionary, in which offsets to complex elements are still 0, followed by
+        # the hashes of these elements, so that equal hashes mean equal encodings.
+        data = self._encode_node(codec, layout)
+        for child in layout.children:
+            data += child.digest
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def _place_nodes(self, layouts, offset, deduplicate):
+        # Assign the 4-byte aligned offsets of the planned nodes starting at the given offset and return the nodes to
+        # write. Nodes identical to one placed before point to it instead, skipping their elements.
+        written = []
+        encodings = {}
+        ends = [0] * (len(layouts) + 1)  # The offset reached before each node, where the preceding subtrees end.
+        self.deduplicated_bytes = 0
+        i = 0
+        while i < len(layouts):
+            ends[i] = offset
+            layout = layouts[i]
+            if deduplicate:
+                original = encodings.get(layout.digest)
+                if original:
+                    layout.offset = original.offset
+                    self.deduplicated_bytes += ends[original.end] - original.offset
+                    i = layout.end
+                    continue
+                encodings[layout.digest] = layout
+            offset += -offset % 4
+            layout.offset = offset
+            offset += layout.get_size()
+            written.append(layout)
+            i += 1
+        return written
+
+    def _encode_node(self, codec, layout):
+        # Encode the array or dictionary with its simple elements and the offsets to its complex elements.
+        values = layout.elements
+        if layout.node_types.translate(None, _direct_node_types):
+            values = self._get_element_values(layout)
+        data = codec.uint32.pack(layout.node_type << 24 | len(values))
+        if layout.node_type == NodeType.Dictionary:
+            # Write the name index and type of each element followed by the value.
+            words = [self._name_indices[name] << 8 | t for name, t in zip(layout.names, layout.node_types)]
+            value_struct = self._get_value_struct(codec, layout.node_types, "I")[0]
+            data += value_struct.pack(*[word for pair in zip(words, values) for word in pair])
         else:
-            raise TypeError("Expected complex value type, not " + type(value).__name__)
+            # Write the element types, and the elements after a padding to the next 4 bytes.
+            value_struct = self._get_value_struct(codec, layout.node_types, None)[0]
+            data += layout.node_types + bytes(-(4 + len(values)) % 4) + value_struct.pack(*values)
+        return data
 
-    def _write_type_and_length(self, writer, node_type, length):
-        value = node_type << 24
-        value |= length
-        writer.write_uint32(value)
+    def _get_element_values(self, layout):
+        # Get the uint32 stored for each element, which is the index of strings and paths, or the offset of complex
+        # elements.
+        values = []
+        children = iter(layout.children)
+        for node_type, element in zip(layout.node_types, layout.elements):
+            if node_type == NodeType.StringIndex:
+                values.append(self._string_indices[element])
+            elif node_type == NodeType.PathIndex:
+                values.append(self._path_indices[element.points.tobytes()])
+            elif node_type == NodeType.Array or node_type == NodeType.Dictionary:
+                values.append(next(children).offset)
+            elif node_type == NodeType.Boolean:
+                values.append(1 if element else 0)
+            else:
+                values.append(element)
+        return values
 
-    def _write_string_index(self, writer, value):
-        writer.write_uint32(self._string_array.index(value))
+    def _encode_sections(self, sections, processes):
+        # Encode the runs of elements in worker processes. Spawned workers need to import this module on their own,
+        # which is only possible outside of Blender.
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            encoded = executor.map(_encode_section, [section.values for section in sections])
+            for section, encoded in zip(sections, encoded):
+                section.encoded = encoded
+                for layout, paths in zip(section.children, encoded.paths):
+                    layout.paths = paths
 
-    def _write_path_index(self, writer, value):
-        writer.write_uint32(self._path_array.index(value))
+    def _encode_section(self, values):
+        # Plan and encode the arrays and dictionaries and all nodes below them consecutively starting at offset 0, with
+        # indices into their own name, string and path arrays. Remember the positions of the offsets and indices to
+        # relocate them later.
+        names = set()
+        strings = set()
+        paths = []
+        layouts = []
+        section = _EncodedSection()
+        for value in values:
+            start = len(paths)
+            section.starts.append(len(layouts))
+            self._plan_node(layouts, value, names, strings, paths)
+            section.paths.append(paths[start:])
+        section.names = sorted(names)
+        section.strings = sorted(strings)
+        self._index_paths(paths)
+        self._name_indices = {name: i for i, name in enumerate(section.names)}
+        self._string_indices = {string: i for i, string in enumerate(section.strings)}
+        codec = binary_io.Codec.of(">")
+        positions = {NodeType.StringIndex: [], NodeType.PathIndex: [], NodeType.Array: [], NodeType.Dictionary: []}
+        name_positions = []
+        for layout in self._place_nodes(layouts, 0, False):
+            section.data += bytes(layout.offset - len(section.data))
+            # Get the index of the first uint32 stored for the elements, and the distance to the next one.
+            length = len(layout.node_types)
+            if layout.node_type == NodeType.Dictionary:
+                name_positions.extend(range(layout.offset // 4 + 1, layout.offset // 4 + 1 + length * 2, 2))
+                start, step = layout.offset // 4 + 2, 2
+            else:
+                start, step = (layout.offset + 4 + length + -(4 + length) % 4) // 4, 1
+            if layout.node_types.translate(None, _direct_node_types):
+                for i, node_type in enumerate(layout.node_types):
+                    node_positions = positions.get(node_type)
+                    if node_positions is not None:
+                        node_positions.append(start + i * step)
+            section.data += self._encode_node(codec, layout)
+        section.starts = [layouts[i].offset for i in section.starts]
+        section.name_positions = numpy.array(name_positions, numpy.intp)
+        section.string_positions = numpy.array(positions[NodeType.StringIndex], numpy.intp)
+        section.path_positions = numpy.array(positions[NodeType.PathIndex], numpy.intp)
+        section.offset_positions = numpy.array(positions[NodeType.Array] + positions[NodeType.Dictionary], numpy.intp)
+        return section
 
-    def _write_array(self, writer, value):
-        self._write_type_and_length(writer, NodeType.Array, len(value))
-        # Write the element types.
-        for element in value:
-            writer.write_byte(NodeType.get_type(element))
-        # Write the elements, which begin after a padding to the next 4 bytes.
-        writer.align(4)
+    def _collect_paths(self, layout, paths):
+        # Collect the paths in the order the serial planner finds them in, taking those below encoded elements from
+        # the runs they were encoded in.
+        children = iter(layout.children)
+        for node_type, element in zip(layout.node_types, layout.elements):
+            if node_type == NodeType.PathIndex:
+                paths.append(element)
+            elif node_type == NodeType.Array or node_type == NodeType.Dictionary:
+                child = next(children)
+                if child.paths is None:
+                    self._collect_paths(child, paths)
+                else:
+                    paths.extend(child.paths)
+
+    def _relocate_section(self, section):
+        # Move the offsets in the encoded run to its final offset, and the indices to the final arrays.
+        encoded = section.encoded
+        for layout, start in zip(section.children, encoded.starts):
+            layout.offset = section.offset + start
+        words = numpy.frombuffer(encoded.data, ">u4")
+        words[encoded.offset_positions] += section.offset
+        name_indices = numpy.array([self._name_indices[name] for name in encoded.names], numpy.uint32)
+        name_words = words[encoded.name_positions]
+        words[encoded.name_positions] = name_indices[name_words >> 8] << 8 | name_words & 0x000000FF
+        string_indices = numpy.array([self._string_indices[string] for string in encoded.strings], numpy.uint32)
+        words[encoded.string_positions] = string_indices[words[encoded.string_positions]]
+        # The run indexed its own deduplicated paths in the order they first appear in it.
+        paths = dict.fromkeys(path.points.tobytes() for layout in section.children for path in layout.paths)
+        path_indices = numpy.array([self._path_indices[points] for points in paths], numpy.uint32)
+        words[encoded.path_positions] = path_indices[words[encoded.path_positions]]
+
+    def _index_paths(self, paths):
+        # Store each path only once, the first of equal paths being referenced by all of them, and remember the index
+        # of the points of each to look them up by hash instead of comparing the points of all paths.
+        self._path_indices = {}
+        unique_paths = []
+        for path in paths:
+            points = path.points.tobytes()
+            if points not in self._path_indices:
+                self._path_indices[points] = len(unique_paths)
+                unique_paths.append(path)
+        self._path_array = PathArray._from_trusted(unique_paths)
+
+    def _get_string_offsets(self, value):
+        # Get the offsets to the strings relative to the node start, where the last one points to the end of the last
+        # string, which is the size of the node.
+        offset = 4 + 4 * (len(value) + 1)  # Relative to node start + all uint32 offsets.
         offsets = []
-        for element in value:
-            offsets.append(self._write_value(writer, element))
-        # Write the contents of complex nodes and satisfy the offsets.
-        for offset, element in zip(offsets, value):
-            if offset:
-                self._write_value_contents(writer, offset, element)
-
-    def _write_dictionary(self, writer, value):
-        self._write_type_and_length(writer, NodeType.Dictionary, len(value))
-        # Write the key-value pairs.
+        for string in value:
+            offsets.append(offset)
+            offset += len(string) + 1
+        offsets.append(offset)
+        return offsets
+
+    def _get_path_offsets(self, value):
+        # Get the offsets to the paths relative to the node start, where the last one points to the end of the last
+        # path, which is the size of the node.
+        offset = 4 + 4 * (len(value) + 1)  # Relative to node start + all uint32 offsets.
         offsets = []
-        for key, val in sorted(value.items()):  # Dictionaries need to be sorted.
-            # Get the index of the key string in the file's name array and the type of the value.
-            key_index = self._name_array.index(key)
-            val_type = NodeType.get_type(val)
-            writer.write_uint32(key_index << 8 | val_type)
-            # Write the elements.
-            offsets.append(self._write_value(writer, val))
-        # Write the value contents.
-        for offset, val in zip(offsets, sorted(value.items())):  # Dictionaries need to be sorted.
-            if offset:
-                self._write_value_contents(writer, offset, val[1])  # Stupid solution to access value of now-tuples.
-
-    def _write_string_array(self, writer, value):
+        for path in value:
+            offsets.append(offset)
+            offset += len(path) * _path_point_dtype.itemsize  # 28 bytes are required for a single point.
+        offsets.append(offset)
+        return offsets
+
+    def _write_type_and_length(self, writer, node_type, length):
+        value = node_type << 24
+        value |= length
+        writer.write_uint32(value)
+
+    def _write_string_array(self, writer, value, offsets):
         writer.align(4)
         self._write_type_and_length(writer, NodeType.StringArray, len(value))
-        # Write the offsets to the strings, where the last one points to the end of the last string.
-        offset = 4 + 4 * (len(value) + 1)  # Relative to node start + all uint32 offsets.
-        for string in value:
-            writer.write_uint32(offset)
-            offset += len(string) + 1
-        writer.write_uint32(offset)
+        writer.write_uint32s(offsets)
         # Write the 0-terminated strings.
         for string in value:
             writer.write_0_string(string)
 
-    def _write_path_array(self, writer, value):
+    def _write_path_array(self, writer, value, offsets):
         writer.align(4)
         self._write_type_and_length(writer, NodeType.PathArray, len(value))
-        # Write the offsets to the paths, where the last one points to the end of the last path.
-        offset = 4 + 4 * (len(value) + 1)  # Relative to node start + all uint32 offsets.
-        for path in value:
-            writer.write_uint32(offset)
-            offset += len(path) * 28  # 28 bytes are required for a single point.
-        writer.write_uint32(offset)
-        # Write the paths.
-        for path in value:
-            self._write_path(writer, path)
+        writer.write_uint32s(offsets)
+        # Encode the points of all paths in one call.
+        if len(value):
+            points = numpy.concatenate([path.points for path in value])
+            writer.write_bytes(points.astype(_path_point_file_dtype).tobytes())
+
+    # ---- Instrumentation ----
+
+    def _instrument_reader(self, node_type, node_reader):
+        # Wrap the reader of complex nodes of the type to measure them. Arrays and dictionaries decoded by lazy proxies
+        # are not measured.
+        def read_node(reader, offset, length):
+            start = time.perf_counter()
+            value, pending = node_reader(reader, offset, length)
+            seconds = time.perf_counter() - start
+            stats = self.stats["decode"]
+            stats["seeks"] += 1  # Each complex node is read at its own offset.
+            if node_type == NodeType.Array:
+                element_types = reader.read_bytes_at(offset + 4, length)
+                size = 4 + length + -(4 + length) % 4 + 4 * length
+            elif node_type == NodeType.Dictionary:
+                words = reader.read_uint32_array_at(offset + 4, length * 2)[0::2]
+                element_types = bytes(word & 0x000000FF for word in words)
+                size = 4 + 8 * length
+            else:
+                element_types = b""
+                size = reader.read_uint32_at(offset + 4 + 4 * length)  # The last offset points to the end of the node.
+            # Let the complex elements inherit the section, or start one below the root.
+            section = self._sections.get(offset)
+            for key, element_offset in pending or ():
+                self._sections.setdefault(element_offset, key if section == "(root)" else section)
+            self._count_node(stats, node_type, element_types, size, seconds, section)
+            return value, pending
+        return read_node
+
+    def _instrument_encoder(self, stats, layouts):
+        # Wrap the encoding of arrays and dictionaries to measure them, mapping the planned nodes to the section they
+        # are in first.
+        root = layouts[0]
+        keys = root.names or range(0, len(root.elements))
+        keys = [key for key, t in zip(keys, root.node_types) if t == NodeType.Array or t == NodeType.Dictionary]
+        sections = {id(root): "(root)"}
+        start = 1
+        for key, layout in zip(keys, root.children):
+            for i in range(start, layout.end):
+                sections[id(layouts[i])] = key
+            start = layout.end
+
+        def encode_node(codec, layout):
+            start = time.perf_counter()
+            data = self._encode_node(codec, layout)
+            seconds = time.perf_counter() - start
+            self._count_node(stats, layout.node_type, layout.node_types, len(data), seconds, sections.get(id(layout)))
+            return data
+        return encode_node
+
+    def _instrument_writer(self, stats, node_type, section, write):
+        # Wrap writing the name, string or path array to measure it.
+        def write_node(writer, value, offsets):
+            start = time.perf_counter()
+            write(writer, value, offsets)
+            self._count_node(stats, node_type, b"", offsets[-1], time.perf_counter() - start, section)
+        return write_node
+
+    def _count_node(self, stats, node_type, element_types, size, seconds, section):
+        # Add the complex node to the statistics of its type and section, and its simple elements to those of their
+        # types. The 4 bytes stored in the node for each simple element count to the type of the element.
+        simple_count = 0
+        for element_type in set(element_types):
+            if not NodeType.Array <= element_type <= NodeType.PathArray:
+                count = element_types.count(element_type)
+                simple_count += count
+                _add_stats(stats["types"], NodeType(element_type).name, count, 4 * count, 0.0)
+        _add_stats(stats["types"], NodeType(node_type).name, 1, size - 4 * simple_count, seconds)
+        if section is not None:
+            _add_stats(stats["sections"], section, 1 + simple_count, size, seconds)
+
+
+class _SectionLayout:
+    # A run of consecutive arrays and dictionaries below the same node, planned and encoded by a worker process.
+    def __init__(self):
+        self.values = None
+        self.children = None  # The layouts receiving the offsets and paths of the values.
+        self.encoded = None
+        self.end = None
+        self.offset = 0
+
+    def get_size(self):
+        return len(self.encoded.data)
+
+
+class _EncodedSection:
+    # Arrays and dictionaries encoded with all nodes below them by a worker process, to be relocated into the file.
+    def __init__(self):
+        self.data = bytearray()
+        self.starts = []  # The offsets of the values in the data.
+        self.names = None
+        self.strings = None
+        self.paths = []  # The paths of each value.
+        # The indices of the uint32s in the data storing name indices, string indices, path indices and offsets.
+        self.name_positions = None
+        self.string_positions = None
+        self.path_positions = None
+        self.offset_positions = None
+
+
+def _encode_section(values):
+    # Entry point of worker processes encoding a run of elements.
+    return File()._encode_section(values)
+
+
+class _NodeLayout:
+    # The planned encoding of an array or dictionary, with its elements classified and sorted once.
+    def __init__(self):
+        self.node_type = None
+        self.names = None  # The sorted keys of a dictionary.
+        self.elements = None
+        self.node_types = None
+        self.children = []  # The layouts of complex elements.
+        self.end = None  # The index following the layouts of all nodes below this one.
+        self.offset = 0
+        self.digest = None
+        self.paths = None  # The paths below the node if it was encoded by a worker process.
+
+    def get_size(self):
+        length = len(self.node_types)
+        if self.node_type == NodeType.Dictionary:
+            return 4 + 8 * length
+        return 4 + length + -(4 + length) % 4 + 4 * length
+
+
+class LazyArray(collections.abc.Sequence):
+    # A read-only list decoding its elements from the BYAML data when they are accessed the first time.
+    _digest = None
+    _parents = None
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyArray)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        value = self._elements[item]
+        if value is _undecoded:
+            index = item % len(self._elements)
+            value = self._load.read_value(self._node_types[index], self._offset + index * 4)
+            self._elements[index] = value
+        return value
+
+    def __init__(self, load, offset, length):
+        self._load = load
+        # Read the element types, the elements begin after a padding to the next 4 bytes.
+        self._node_types = load.reader.read_bytes_at(offset + 4, length)
+        self._offset = offset + 4 + length
+        self._offset += -self._offset % 4
+        self._elements = [_undecoded] * length
 
-    def _write_path(self, writer, path):
-        for point in path:
-            self._write_path_point(writer, point)
+    def __len__(self):
+        return len(self._elements)
+
+    def __reduce__(self):
+        # Copies and pickles are tracked arrays, as the data of proxies is not available to them.
+        return TrackedArray, (list(self),)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def materialize(self):
+        return TrackedArray(_materialize(value) for value in self)
+
+
+class LazyDictionary(collections.abc.Mapping):
+    # A read-only dictionary decoding its values from the BYAML data when they are accessed the first time.
+    _digest = None
+    _parents = None
+
+    def __contains__(self, item):
+        return item in self._get_entries()
+
+    def __getitem__(self, item):
+        value = self._values.get(item, _undecoded)
+        if value is _undecoded:
+            node_type, offset = self._get_entries()[item]
+            value = self._load.read_value(node_type, offset)
+            self._values[item] = value
+        return value
+
+    def __init__(self, load, offset, length):
+        self._load = load
+        self._offset = offset
+        self._length = length
+        self._entries = None
+        self._values = {}
+
+    def __iter__(self):
+        return iter(self._get_entries())
 
-    def _write_path_point(self, writer, point):
-        writer.write_singles(point.position)
-        writer.write_singles(point.normal)
-        writer.write_uint32(point.unknown)
+    def __len__(self):
+        return self._length
 
-    def _write_boolean(self, writer, value):
-        writer.write_uint32(1 if value else 0)
+    def __reduce__(self):
+        # Copies and pickles are tracked dictionaries, as the data of proxies is not available to them.
+        return TrackedDictionary, (dict(self),)
 
-    def _write_integer(self, writer, value):
-        writer.write_int32(value)
+    def __repr__(self):
+        return repr(dict(self))
 
-    def _write_float(self, writer, value):
-        writer.write_single(value)
+    def materialize(self):
+        return TrackedDictionary((key, _materialize(value)) for key, value in self.items())
+
+    def _get_entries(self):
+        # Read the name index and type of all elements on first access, mapping names to types and value offsets.
+        if self._entries is None:
+            self._entries = {}
+            words = self._load.reader.read_uint32_array_at(self._offset + 4, self._length * 2)
+            name_array = self._load.decoder._name_array
+            for i in range(0, self._length):
+                idx_and_type = words[i * 2]
+                node_name = name_array[idx_and_type >> 8 & 0xFFFFFFFF]
+                self._entries[node_name] = (idx_and_type & 0x000000FF, self._offset + 8 + i * 8)
+        return self._entries
+
+
+class _LazyLoad:
+    # The data of one lazy load of a File, and a File of its own decoding elements of the proxies with the names,
+    # strings, paths and nodes of that data, so that they remain valid when the loading file decodes other data. The
+    # data is released once neither the file nor any proxy references the load anymore.
+    def __init__(self, file, reader):
+        self.file = file
+        self.reader = reader
+        weakref.finalize(self, reader.close)
+        self.decoder = File()
+        self.decoder._lazy_load = self
+        self.decoder._name_array = file._name_array
+        self.decoder._string_array = file._string_array
+        self.decoder._path_array = file._path_array
+        self.decoder._nodes = file._nodes
+        self.decoder._dictionary_shapes = file._dictionary_shapes
+        self.decoder._value_structs = file._value_structs
+
+    def read_root(self, offset):
+        root = self.decoder._read_lazy_node(self.reader, offset)
+        self.file.shared_nodes = self.decoder.shared_nodes
+        return root
+
+    def read_value(self, node_type, offset):
+        value = self.decoder._read_lazy_value(self.reader, node_type, offset)
+        # Report the nodes shared so far while the file still holds this load.
+        if self.file._lazy_load is self:
+            self.file.shared_nodes = self.decoder.shared_nodes
+        return value
+
+
+_undecoded = object()  # Placeholder for lazy elements which have not been decoded yet.
+
+
+def _materialize(value):
+    # Returns the value with all lazy nodes in it decoded.
+    if isinstance(value, (LazyArray, LazyDictionary)):
+        return value.materialize()
+    return value
+
+
+def _create_stats():
+    # Returns the statistics of decoding or encoding a file: the total time, the number of jumps to node offsets, and
+    # the number, bytes and time of nodes per node type name and per section. Sections are the elements of the root,
+    # "(root)" for the root itself, and "(names)", "(strings)" and "(paths)" for the arrays following the header. The
+    # time of simple nodes is included in the time of the array or dictionary they are stored in.
+    return {"seconds": 0.0, "seeks": 0, "types": {}, "sections": {}}
+
+
+def _add_stats(entries, key, nodes, size, seconds):
+    entry = entries.get(key)
+    if entry is None:
+        entry = {"nodes": 0, "bytes": 0, "seconds": 0.0}
+        entries[key] = entry
+    entry["nodes"] += nodes
+    entry["bytes"] += size
+    entry["seconds"] += seconds
+
+
+def _copy_node(value):
+    # Returns a copy of the arrays and dictionaries in the value, sharing the other values.
+    if isinstance(value, list):
+        return TrackedArray(_copy_node(element) for element in value)
+    elif isinstance(value, dict):
+        return TrackedDictionary((key, _copy_node(val)) for key, val in value.items())
+    return value
+
+
+class TrackedArray(list):
+    # A list remembering its digest until it is modified. Decoded arrays are of this type.
+    _digest = None
+    _parents = None  # The tracked arrays and dictionaries which remember a digest computed from this one, by their ID.
+
+    def __delitem__(self, key):
+        if self._digest is not None:
+            _invalidate(self)
+        super().__delitem__(key)
+
+    def __iadd__(self, other):
+        if self._digest is not None:
+            _invalidate(self)
+        return super().__iadd__(other)
+
+    def __imul__(self, other):
+        if self._digest is not None:
+            _invalidate(self)
+        return super().__imul__(other)
+
+    def __reduce__(self):
+        # Neither the digest nor the parents are copied or pickled, and the elements are restored in one call rather
+        # than one by one through the overridden methods.
+        return TrackedArray, (list(self),)
+
+    def __setitem__(self, key, value):
+        if self._digest is not None:
+            _invalidate(self)
+        super().__setitem__(key, value)
+
+    def append(self, x):
+        if self._digest is not None:
+            _invalidate(self)
+        super().append(x)
+
+    def clear(self):
+        if self._digest is not None:
+            _invalidate(self)
+        super().clear()
+
+    def extend(self, x):
+        if self._digest is not None:
+            _invalidate(self)
+        super().extend(x)
+
+    def insert(self, i, x):
+        if self._digest is not None:
+            _invalidate(self)
+        super().insert(i, x)
+
+    def pop(self, i=-1):
+        if self._digest is not None:
+            _invalidate(self)
+        return super().pop(i)
+
+    def remove(self, x):
+        if self._digest is not None:
+            _invalidate(self)
+        super().remove(x)
+
+    def reverse(self):
+        if self._digest is not None:
+            _invalidate(self)
+        super().reverse()
+
+    def sort(self, *args, **kwargs):
+        if self._digest is not None:
+            _invalidate(self)
+        super().sort(*args, **kwargs)
+
+
+class TrackedDictionary(dict):
+    # A dictionary remembering its digest until it is modified. Decoded dictionaries are of this type.
+    _digest = None
+    _parents = None  # The tracked arrays and dictionaries which remember a digest computed from this one, by their ID.
+
+    def __delitem__(self, key):
+        if self._digest is not None:
+            _invalidate(self)
+        super().__delitem__(key)
+
+    def __ior__(self, other):
+        if self._digest is not None:
+            _invalidate(self)
+        return super().__ior__(other)
+
+    def __reduce__(self):
+        # Neither the digest nor the parents are copied or pickled, and the items are restored in one call rather than
+        # one by one through the overridden methods.
+        return TrackedDictionary, (dict(self),)
+
+    def __setitem__(self, key, value):
+        if self._digest is not None:
+            _invalidate(self)
+        super().__setitem__(key, value)
+
+    def clear(self):
+        if self._digest is not None:
+            _invalidate(self)
+        super().clear()
+
+    def pop(self, key, *args):
+        if self._digest is not None:
+            _invalidate(self)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        if self._digest is not None:
+            _invalidate(self)
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if self._digest is not None:
+            _invalidate(self)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        if self._digest is not None:
+            _invalidate(self)
+        super().update(*args, **kwargs)
+
+
+def get_digest(value):
+    # Returns a stable 16-byte hash of the content of the BYAML value, which is equal for values written equally, and
+    # independent of the file they are read from or written to. Arrays and dictionaries are hashed over the hashes of
+    # their elements, and tracked and lazy ones remember their hash until they are modified, so that the hash of an
+    # unchanged subtree is returned without visiting it again.
+    return _get_digest(value)[0]
+
+
+def _get_digest(value):
+    # Returns the digest of the value and whether it may be remembered, which is only the case if all arrays and
+    # dictionaries in it are tracked or read-only, and thus report modifications.
+    digest = getattr(value, "_digest", None)
+    if digest is not None:
+        return digest, True
+    node_type = NodeType.get_type(value)
+    data = bytearray((node_type,))
+    if node_type == NodeType.Array or node_type == NodeType.Dictionary:
+        cacheable = isinstance(value, _cacheable_types)
+        data += len(value).to_bytes(3, "big")
+        if node_type == NodeType.Dictionary:
+            items = sorted(value.items())  # Dictionaries need to be sorted.
+            for key, val in items:
+                key = key.encode("utf-8")
+                data += len(key).to_bytes(4, "big") + key
+            elements = [val for key, val in items]
+        else:
+            elements = value
+        tracked = []
+        for element in elements:
+            element_digest, element_cacheable = _get_digest(element)
+            data += element_digest
+            cacheable = cacheable and element_cacheable
+            if element_cacheable and hasattr(element, "_parents"):
+                tracked.append(element)
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if cacheable:
+            # Let modified elements clear this digest too.
+            for element in tracked:
+                if element._parents is None:
+                    element._parents = {}
+                element._parents[id(value)] = value
+            value._digest = digest
+        return digest, cacheable
+    codec = binary_io.Codec.of(">")
+    if node_type == NodeType.StringIndex:
+        string = value.encode("utf-8")
+        data += len(string).to_bytes(4, "big") + string
+    elif node_type == NodeType.PathIndex:
+        data += len(value).to_bytes(4, "big") + value.points.astype(_path_point_file_dtype).tobytes()
+        value._digest = hashlib.blake2b(data, digest_size=16).digest()
+        return value._digest, True
+    elif node_type == NodeType.Boolean:
+        data += codec.uint32.pack(1 if value else 0)
+    elif node_type == NodeType.Integer:
+        data += codec.int32.pack(value)
+    elif node_type == NodeType.Float:
+        data += codec.single.pack(value)
+    else:
+        raise TypeError("Expected BYAML compatible value type, not " + type(value).__name__)
+    return hashlib.blake2b(data, digest_size=16).digest(), True
+
+
+def _invalidate(node):
+    # Clear the digest of the modified node and of the nodes containing it. A node only remembers its digest while the
+    # nodes below it do, so nodes without one have no parents with one.
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if node._digest is not None:
+            node._digest = None
+            if node._parents:
+                nodes.extend(node._parents.values())
+
+
+class EventType(enum.IntEnum):
+    StartArray = 0,  # value is the offset of the array
+    EndArray = 1,  # value is the offset of the array
+    StartDictionary = 2,  # value is the offset of the dictionary
+    EndDictionary = 3,  # value is the offset of the dictionary
+    Value = 4  # value is any other node
+
+
+class EventReader:
+    # Reads BYAML data as a stream of (EventType, key, value) events without building the tree. The key is the name in
+    # a dictionary, the index in an array, or None for the root. Call skip() after receiving a start event to continue
+    # with its end event, without decoding the elements in between.
+    def __init__(self, raw):
+        self.raw = raw
+        self._file = File()
+        self._reader = None
+        self._root_offset = None
+        self._skip = False
+
+    def __enter__(self):
+        self._reader, header = self._file._open(self.raw)
+        self._root_offset = header.root_offset
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file._close(self._reader)
+        self._reader = None
+
+    def __iter__(self):
+        return self._read_events()
+
+    def skip(self):
+        self._skip = True
+
+    def _read_events(self):
+        # Keep the containers being read on a stack with their end event and an iterator over their elements.
+        containers = []
+        yield from self._start_container(containers, None, self._root_offset)
+        while containers:
+            end_event, elements = containers[-1]
+            element = next(elements, None)
+            if not element:
+                containers.pop()
+                yield end_event
+                continue
+            key, node_type, offset = element
+            if node_type == NodeType.Array or node_type == NodeType.Dictionary:
+                yield from self._start_container(containers, key, self._reader.read_uint32_at(offset))
+            elif node_type == NodeType.StringArray or node_type == NodeType.PathArray:
+                yield (EventType.Value, key, self._file._read_node(self._reader, self._reader.read_uint32_at(offset)))
+            else:
+                yield (EventType.Value, key, self._file._read_value(self._reader, node_type, offset))
+
+    def _start_container(self, containers, key, offset):
+        type_and_length = self._reader.read_uint32_at(offset)
+        node_type = type_and_length >> 24
+        length = type_and_length & 0x00FFFFFF
+        if node_type == NodeType.Array:
+            start_type, end_type = EventType.StartArray, EventType.EndArray
+            elements = self._read_array_elements(offset, length)
+        elif node_type == NodeType.Dictionary:
+            start_type, end_type = EventType.StartDictionary, EventType.EndDictionary
+            elements = self._read_dictionary_elements(offset, length)
+        else:
+            raise AssertionError("Unexpected node type " + str(node_type) + ".")
+        self._skip = False
+        yield (start_type, key, offset)
+        if self._skip:
+            self._skip = False
+            yield (end_type, key, offset)
+        else:
+            containers.append(((end_type, key, offset), elements))
+
+    def _read_array_elements(self, offset, length):
+        # Read the element types, the elements begin after a padding to the next 4 bytes.
+        node_types = self._reader.read_bytes_at(offset + 4, length)
+        offset += 4 + length
+        offset += -offset % 4
+        for i in range(0, length):
+            yield (i, node_types[i], offset + i * 4)
+
+    def _read_dictionary_elements(self, offset, length):
+        for i in range(0, length):
+            element_offset = offset + 4 + i * 8
+            idx_and_type = self._reader.read_uint32_at(element_offset)
+            node_name = self._file._name_array[idx_and_type >> 8 & 0xFFFFFFFF]
+            yield (node_name, idx_and_type & 0x000000FF, element_offset + 4)
+
+
+class Selector:
+    # A path query selecting nodes by dictionary keys and array indices, like "Obj[*].ObjId" or "Area[3].Translate".
+    # Keys are separated by dots and indices enclosed in brackets, negative indices count from the end. A * selects all
+    # elements of arrays and dictionaries, and keys containing dots or brackets are quoted in brackets, like ["A.B"].
+    # Steps are the keys, the indices, and None for wildcards.
+    def __init__(self, text):
+        self.text = text
+        self.steps = []
+        position = 0
+        while position < len(text):
+            match = _selector_step.match(text, position)
+            # Keys are separated from previous steps by a dot.
+            if not match or match.group("key") is not None and match.group(0).startswith(".") != (position > 0):
+                raise AssertionError("Invalid selector " + repr(text) + " at position " + str(position) + ".")
+            key = match.group("key")
+            index = match.group("index")
+            if key is not None:
+                self.steps.append(None if key == "*" else key)
+            elif index == "*":
+                self.steps.append(None)
+            elif index.startswith('"'):
+                self.steps.append(index[1:-1])
+            else:
+                self.steps.append(int(index))
+            position = match.end()
+
+    def __repr__(self):
+        return "Selector({!r})".format(self.text)
+
+    def match(self, value):
+        # Returns the (path, value) pairs of the nodes below the decoded value matching the selector, in file order.
+        matches = [((), value)]
+        for step in self.steps:
+            matches = [element for path, node in matches for element in Selector._match_elements(path, node, step)]
+        return matches
+
+    @staticmethod
+    def _match_elements(path, value, step):
+        if isinstance(value, (dict, LazyDictionary)):
+            if step is None:
+                keys = sorted(value)  # Dictionaries are sorted in the file.
+            elif isinstance(step, str) and step in value:
+                keys = (step,)
+            else:
+                return ()
+            return [(path + (key,), value[key]) for key in keys]
+        elif isinstance(value, (list, LazyArray)):
+            if step is None:
+                indices = range(0, len(value))
+            elif isinstance(step, int) and -len(value) <= step < len(value):
+                indices = (step % len(value),)
+            else:
+                return ()
+            return [(path + (i,), value[i]) for i in indices]
+        return ()
+
+
+_selector_step = re.compile(r'\.?(?P<key>[^.\[\]]+)|\[(?P<index>\*|-?[0-9]+|"[^"]*")\]')
+
+
+def query(value, selector, paths=False):
+    # Returns the values below the decoded value matching the selector text or Selector, or their (path, value) pairs,
+    # where the path is the tuple of keys and indices leading to the value.
+    if not isinstance(selector, Selector):
+        selector = Selector(selector)
+    matches = selector.match(value)
+    return matches if paths else [value for path, value in matches]
+
+
+def query_raw(raw, selector, paths=False):
+    # Returns the values in the BYAML data matching the selector like query(), walking the data by offsets and only
+    # decoding the nodes matched, so that questions about many files do not require decoding them completely.
+    if not isinstance(selector, Selector):
+        selector = Selector(selector)
+    return File()._query_raw(raw, selector, paths)
+
+
+class Index:
+    # The offsets of the top-level sections of a BYAML file and of the elements of those which are arrays, with the
+    # header, names and strings, to decode any of them without reading the rest of the file. Sections are keyed by
+    # their name, or their index if the root is an array, and map to (node type, offset, size) entries, while the
+    # elements of arrays are an array of such entries. The offset is the one of the value for simple values.
+    # The index is stored in a sidecar file next to the BYAML file, s. get_index().
+    def __init__(self):
+        self.size = None
+        self.mtime_ns = None
+        self.header = None
+        self.names = []
+        self.strings = []
+        self.sections = {}
+        self.elements = {}
+
+    @staticmethod
+    def load(reader):
+        self = Index()
+        if reader.read_raw_string(4) != "BYIX":
+            raise AssertionError("Invalid BYAML index header.")
+        if reader.read_uint32() != 0x00000001:
+            raise AssertionError("Unsupported BYAML index version.")
+        self.size, self.mtime_ns = reader.read_structs("QQ", 1)[0]
+        self.header = Header()
+        self.header.name_array_offset = reader.read_uint32()
+        self.header.string_array_offset = reader.read_uint32()
+        self.header.path_array_offset = reader.read_uint32()
+        self.header.root_offset = reader.read_uint32()
+        root_is_array = reader.read_uint32() == NodeType.Array
+        self.names = Index._read_strings(reader)
+        self.strings = Index._read_strings(reader)
+        for i in range(0, reader.read_uint32()):
+            key, node_type, offset, size, element_count = reader.read_uint32s(5)
+            key = key if root_is_array else self.names[key]
+            self.sections[key] = (node_type, offset, size)
+            if node_type == NodeType.Array:
+                elements = reader.read_uint32_array(element_count * 3)
+                self.elements[key] = numpy.array(elements, numpy.uint32).reshape(-1, 3)
+        return self
+
+    def save(self, writer):
+        writer.write_raw_string("BYIX")
+        writer.write_uint32(0x00000001)
+        writer.write_structs("QQ", [(self.size, self.mtime_ns)])
+        writer.write_uint32(self.header.name_array_offset)
+        writer.write_uint32(self.header.string_array_offset)
+        writer.write_uint32(self.header.path_array_offset)
+        writer.write_uint32(self.header.root_offset)
+        root_is_array = any(isinstance(key, int) for key in self.sections)
+        writer.write_uint32(NodeType.Array if root_is_array else NodeType.Dictionary)
+        self._write_strings(writer, self.names)
+        self._write_strings(writer, self.strings)
+        writer.write_uint32(len(self.sections))
+        name_indices = {name: i for i, name in enumerate(self.names)}
+        for key, (node_type, offset, size) in self.sections.items():
+            elements = self.elements.get(key, ())
+            writer.write_uint32s((key if root_is_array else name_indices[key], node_type, offset, size, len(elements)))
+            if len(elements):
+                writer.write_uint32s(numpy.ravel(elements))
+
+    @staticmethod
+    def _read_strings(reader):
+        # Read the count and size of the strings, followed by all of them 0-terminated and a padding to 4 bytes.
+        count, size = reader.read_uint32s(2)
+        strings = reader.read_bytes(size).decode("latin-1").split("\0")[:count]
+        reader.align(4)
+        return string_pool.intern(strings)
+
+    def _write_strings(self, writer, strings):
+        data = "".join(string + "\0" for string in strings).encode("latin-1")
+        writer.write_uint32s((len(strings), len(data)))
+        writer.write_bytes(data)
+        writer.write_bytes(bytes(-len(data) % 4))
+
+
+def get_index(file_path, save=True):
+    # Returns the index of the BYAML file at the path from its ".idx" sidecar file, or builds it if the sidecar is
+    # missing or does not match the size and modification time of the file anymore, and saves it as the sidecar if
+    # wanted.
+    index_path = os.fspath(file_path) + ".idx"
+    status = os.stat(file_path)
+    try:
+        with binary_io.MemoryReader(index_path) as reader:
+            reader.endianness = ">"
+            index = Index.load(reader)
+        if index.size == status.st_size and index.mtime_ns == status.st_mtime_ns:
+            return index
+    except (OSError, ValueError, EOFError, AssertionError, IndexError, struct.error):
+        pass  # Missing, empty or invalid sidecar, which is rebuilt.
+    index = File()._build_index(file_path)
+    if save:
+        try:
+            with binary_io.MemoryWriter(index_path) as writer:
+                writer.endianness = ">"
+                index.save(writer)
+        except OSError:
+            pass  # The sidecar is optional, e.g. next to files in read-only directories.
+    return index
+
+
+class Cache:
+    # A disk cache of decoded trees in a directory, keyed by the hash of the data they were decoded from, which
+    # File.load_raw() takes trees from instead of decoding the data again if set as the module's cache. Entries are
+    # pickled with protocol 5, storing the points of paths out-of-band, and the least recently used ones are removed
+    # when all of them exceed the size limit in bytes.
+    def __init__(self, directory, size_limit=256 << 20):
+        self.directory = directory
+        self.size_limit = size_limit
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, data, copy_shared):
+        # Trees with copied shared nodes and the ones of other cache versions are stored separately, as well as the ones
+        # pickled by this module under another name, e.g. inside and outside of Blender, or with another NumPy version.
+        content_hash = hashlib.blake2b(data, digest_size=20)
+        content_hash.update(bytes((_cache_version, copy_shared)))
+        content_hash.update("{}\0{}".format(__name__, numpy.__version__).encode("ascii"))
+        return content_hash.hexdigest()
+
+    def load(self, key):
+        # Returns the root and the number of shared nodes stored under the key, or None if there is no such entry.
+        path = os.path.join(self.directory, key + ".pickle")
+        try:
+            with open(path, "rb") as file:
+                magic, buffer_count, pickle_size, checksum = _cache_header.unpack(file.read(_cache_header.size))
+                if magic != b"BYPC":
+                    raise struct.error("Invalid BYAML cache entry.")
+                buffer_sizes = struct.unpack("<{}Q".format(buffer_count), file.read(8 * buffer_count))
+                data = file.read(pickle_size)
+                if len(data) != pickle_size:
+                    raise struct.error("Truncated BYAML cache entry.")
+                # Read the points of paths into buffers of their own, which the unpickled arrays keep using.
+                buffers = []
+                for buffer_size in buffer_sizes:
+                    buffer = bytearray(buffer_size)
+                    if file.readinto(buffer) != buffer_size:
+                        raise struct.error("Truncated BYAML cache entry.")
+                    buffers.append(buffer)
+            if _get_cache_checksum(data, buffers) != checksum:
+                raise struct.error("Corrupted BYAML cache entry.")
+            os.utime(path)  # Mark the entry as recently used.
+        except OSError:
+            self.misses += 1
+            return None
+        except struct.error:
+            self._discard(path)
+            return None
+        # Unpickling creates many containers, which makes garbage collection run needlessly often.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            entry = pickle.loads(data, buffers=buffers)
+        except Exception:  # E.g. entries referencing classes which are no longer available.
+            self._discard(path)
+            return None
+        finally:
+            if enabled:
+                gc.enable()
+        self.hits += 1
+        return entry
+
+    def save(self, key, root, shared_nodes):
+        # Store the tree under the key, then remove the least recently used entries exceeding the size limit.
+        buffers = []
+        data = pickle.dumps((root, shared_nodes), 5, buffer_callback=buffers.append)
+        buffers = [buffer.raw() for buffer in buffers]
+        path = os.path.join(self.directory, key + ".pickle")
+        temporary_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary_path, "wb") as file:
+                file.write(_cache_header.pack(b"BYPC", len(buffers), len(data), _get_cache_checksum(data, buffers)))
+                file.write(struct.pack("<{}Q".format(len(buffers)), *(buffer.nbytes for buffer in buffers)))
+                file.write(data)
+                for buffer in buffers:
+                    file.write(buffer)
+            os.replace(temporary_path, path)  # Other processes never see partially written entries.
+            self._evict()
+        except OSError:
+            pass  # The cache is optional, e.g. in read-only or full directories.
+
+    def _discard(self, path):
+        # Count a damaged entry as a miss and remove it, so that it is replaced by the next save.
+        self.misses += 1
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Removed by another process.
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as directory:
+            for entry in directory:
+                if entry.name.endswith(".pickle"):
+                    status = entry.stat()
+                    entries.append((status.st_mtime_ns, status.st_size, entry.path))
+        size = sum(entry[1] for entry in entries)
+        for mtime_ns, entry_size, path in sorted(entries):
+            if size <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Removed by another process.
+            size -= entry_size
+
+
+_cache_version = 2  # Increased when trees are decoded or pickled differently, so that old entries are not used.
+# The magic, the number of out-of-band buffers, the size of the pickle and the checksum of the pickle and the buffers.
+_cache_header = struct.Struct("<4sIQ16s")
+
+
+def _get_cache_checksum(data, buffers):
+    checksum = hashlib.blake2b(data, digest_size=16)
+    for buffer in buffers:
+        checksum.update(buffer)
+    return checksum.digest()
+
+
+class StringPool:
+    # The names and strings of all decoded files, so that the files share one str object for each of them instead of
+    # allocating their own. The strings are also interned with sys.intern() to look up dictionary keys which are the
+    # same interned literals by identity. Reports how many strings it holds and how many of those requested it had.
+    def __init__(self):
+        self.lookups = 0
+        self.hits = 0
+        self._strings = {}
+
+    def __len__(self):
+        return len(self._strings)
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def clear(self):
+        self.lookups = 0
+        self.hits = 0
+        self._strings = {}
+
+    def intern(self, strings):
+        # Returns a list of the pooled strings equal to the given ones, adding those which are not pooled yet.
+        pooled_strings = self._strings
+        size = len(pooled_strings)
+        result = []
+        for string in strings:
+            pooled_string = pooled_strings.get(string)
+            if pooled_string is None:
+                pooled_string = pooled_strings[string] = sys.intern(string)
+            result.append(pooled_string)
+        self.lookups += len(result)
+        self.hits += len(result) - (len(pooled_strings) - size)
+        return result
+
+
+string_pool = StringPool()  # The pool shared by all files decoded in this process.
 
 
 class Header:
@@ -364,9 +1789,9 @@ class NodeType(enum.IntEnum):
             return NodeType.StringIndex
         elif isinstance(node, Path):
             return NodeType.PathIndex
-        elif isinstance(node, list):
+        elif isinstance(node, (list, LazyArray)):
             return NodeType.Array
-        elif isinstance(node, dict):
+        elif isinstance(node, (dict, LazyDictionary)):
             return NodeType.Dictionary
         elif isinstance(node, StringArray):
             return NodeType.StringArray
@@ -382,6 +1807,23 @@ class NodeType(enum.IntEnum):
             raise TypeError("Expected BYAML compatible node type, not " + type(node).__name__)
 
 
+def _get_value_format(node_type):
+    # Returns the struct format of the uint32 stored for the node type in arrays and dictionaries, or 0 if the node type
+    # is unknown, which is no valid format.
+    if node_type == NodeType.Float:
+        return ord("f")
+    elif node_type == NodeType.Integer:
+        return ord("i")
+    elif node_type in set(NodeType):
+        return ord("I")
+    return 0
+
+
+# The struct formats indexed by the node type byte, to translate type bytes into formats.
+_value_formats = bytes(_get_value_format(node_type) for node_type in range(0, 256))
+_direct_node_types = bytes((NodeType.Integer, NodeType.Float))  # Node types of which values need no conversion.
+
+
 class Array:
     def __delitem__(self, key):
         del self._elements[key]
@@ -411,17 +1853,25 @@ class Array:
     def __str__(self):
         return str(self._elements)
 
+    @classmethod
+    def _from_trusted(cls, elements):
+        # Create the array on a list of elements known to be of the element type, without checking or copying them.
+        # Only to be used by the reader and writer, which create the elements themselves.
+        self = cls()
+        self._elements = elements
+        return self
+
     def append(self, x):
         self._check_type(x)
         self._elements.append(x)
 
     def extend(self, x):
-        for elem in x:
+        elements = list(x)
+        for elem in elements:
             self._check_type(elem)
-            self.append(elem)
+        self._elements.extend(elements)
 
     def index(self, x):
-        self._check_type(x)
         return self._elements.index(x)
 
     def _check_type(self, x):
@@ -439,22 +1889,196 @@ class PathArray(Array):
         super().__init__(Path, elements)
 
 
-class Path(Array):
-    def __init__(self):
-        super().__init__(PathPoint)
+class Path:
+    # The points of a path, stored in a structured NumPy array with a position, normal and unknown field per point,
+    # taking the 28 bytes per point they take in the file. The positions, normals and unknowns are read-only views of
+    # its columns, and indexing or iterating the path returns views of single points. Its digest is remembered until
+    # it is modified through its methods, the point views or by assigning the columns, modifying the points array
+    # directly requires assigning it again.
+    _digest = None
+    _parents = None
+
+    def __delitem__(self, key):
+        self.points = numpy.delete(self.points, key)
+
+    def __eq__(self, other):
+        return isinstance(other, Path) and self.points.tobytes() == other.points.tobytes()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return Path(self.points[item])
+        if not -len(self.points) <= item < len(self.points):
+            raise IndexError("Path point index out of range.")
+        return PathPointView(self, item % len(self.points))
+
+    def __getstate__(self):
+        return {"points": self.points}  # Neither the digest nor the parents are copied or pickled.
+
+    def __init__(self, points=None):
+        if points is None:
+            points = numpy.zeros(0, _path_point_dtype)
+        self.points = numpy.asarray(points, _path_point_dtype)
+
+    def __iter__(self):
+        return (PathPointView(self, i) for i in range(0, len(self.points)))
+
+    def __len__(self):
+        return len(self.points)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return str(list(self))
+
+    def __setattr__(self, key, value):
+        if key in _path_arrays and self._digest is not None:
+            _invalidate(self)
+        super().__setattr__(key, value)
+
+    def __setitem__(self, key, value):
+        self._check_type(value)
+        if self._digest is not None:
+            _invalidate(self)
+        self.points[key] = value.to_record()
+
+    def __str__(self):
+        return str(list(self))
+
+    def append(self, x):
+        self.extend((x,))
+
+    def extend(self, x):
+        records = []
+        for elem in x:
+            self._check_type(elem)
+            records.append(elem.to_record())
+        self.points = numpy.concatenate((self.points, numpy.array(records, _path_point_dtype)))
+
+    def index(self, x):
+        self._check_type(x)
+        return list(self).index(x)
+
+    @property
+    def normals(self):
+        return self._get_column("normal")
+
+    @normals.setter
+    def normals(self, value):
+        self.points["normal"] = value
+
+    @property
+    def positions(self):
+        return self._get_column("position")
+
+    @positions.setter
+    def positions(self, value):
+        self.points["position"] = value
+
+    @property
+    def unknowns(self):
+        return self._get_column("unknown")
+
+    @unknowns.setter
+    def unknowns(self, value):
+        self.points["unknown"] = value
+
+    def _check_type(self, x):
+        if not isinstance(x, PathPoint):
+            raise TypeError("Expected " + PathPoint.__name__ + ", not " + type(x).__name__)
+
+    def _get_column(self, name):
+        # Columns are modified by assigning them, which invalidates the digest.
+        column = self.points[name]
+        column.flags.writeable = False
+        return column
 
 
 class PathPoint:
+    __slots__ = ("position", "normal", "unknown")
+
     def __eq__(self, other):
-        return isinstance(other, self.__class__) \
+        return isinstance(other, PathPoint) \
             and self.position == other.position \
             and self.normal == other.normal \
             and self.unknown == other.unknown
 
-    def __init__(self):
-        self.position = None
-        self.normal = None
-        self.unknown = None
+    def __init__(self, position=None, normal=None, unknown=None):
+        self.position = position
+        self.normal = normal
+        self.unknown = unknown
 
     def __ne__(self, other):
         return not self.__eq__(other)
+
+    def __repr__(self):
+        return "PathPoint({}, {}, {})".format(self.position, self.normal, self.unknown)
+
+    @staticmethod
+    def from_record(record):
+        return PathPoint(tuple(record["position"].tolist()), tuple(record["normal"].tolist()), int(record["unknown"]))
+
+    def to_record(self):
+        return tuple(self.position), tuple(self.normal), self.unknown
+
+
+class PathPointView(PathPoint):
+    # A point of a path, reading and writing its fields in the points array of the path rather than holding them.
+    __slots__ = ("_path", "_index")
+
+    def __init__(self, path, index):
+        object.__setattr__(self, "_path", path)
+        object.__setattr__(self, "_index", index)
+
+    def __reduce__(self):
+        return PathPoint, (self.position, self.normal, self.unknown)  # Pickled and copied without the path.
+
+    def __setattr__(self, key, value):
+        if self._path._digest is not None:
+            _invalidate(self._path)
+        object.__setattr__(self, key, value)
+
+    @property
+    def normal(self):
+        return tuple(self._path.points[self._index]["normal"].tolist())
+
+    @normal.setter
+    def normal(self, value):
+        self._path.points[self._index]["normal"] = value
+
+    @property
+    def position(self):
+        return tuple(self._path.points[self._index]["position"].tolist())
+
+    @position.setter
+    def position(self, value):
+        self._path.points[self._index]["position"] = value
+
+    @property
+    def unknown(self):
+        return int(self._path.points[self._index]["unknown"])
+
+    @unknown.setter
+    def unknown(self, value):
+        self._path.points[self._index]["unknown"] = value
+
+
+# The layout of a path point in memory and in the big-endian file, 0x1C bytes in size.
+_path_point_dtype = numpy.dtype([("position", "f4", (3,)), ("normal", "f4", (3,)), ("unknown", "u4")])
+_path_point_file_dtype = _path_point_dtype.newbyteorder(">")
+_path_arrays = ("points", "positions", "normals", "unknowns")  # Attributes of paths replacing their points.
+
+# Node types of values by their exact class, to classify them without testing instances of subclasses first.
+_node_types_by_class = {
+    str: NodeType.StringIndex,
+    Path: NodeType.PathIndex,
+    list: NodeType.Array,
+    dict: NodeType.Dictionary,
+    TrackedArray: NodeType.Array,
+    TrackedDictionary: NodeType.Dictionary,
+    bool: NodeType.Boolean,
+    int: NodeType.Integer,
+    float: NodeType.Float
+}
+# Types of arrays and dictionaries which report modifications, so that their digest can be remembered.
+_cacheable_types = (TrackedArray, TrackedDictionary, LazyArray, LazyDictionary)
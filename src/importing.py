@@ -43,7 +43,7 @@ class Importer:
         # Read in the file data.
         with open(self.filepath, "rb") as raw:
             addon.loaded_byaml = byaml.File()
-            addon.loaded_byaml.load_raw(raw)
+            addon.loaded_byaml.load_raw(raw, copy_shared=True)  # The exporter modifies nodes of this file.
         # Import the data into Blender objects.
         self._convert(addon.loaded_byaml.root)
         return {'FINISHED'}
@@ -749,7 +749,7 @@ def _ensure_loaded():
         if not os.path.isfile(objflow_path):
             raise AssertionError("objflow.byaml does not exist as '{}'. Correct your game directory.".format(objflow_path))
         _objflow = byaml.File()
-        _objflow.load_raw(open(objflow_path, "rb"))
+        _objflow.load_raw(open(objflow_path, "rb"), lazy=True)  # Only a few fields of each entry are used.
         # Create lookup dictionaries and arrays for quick access.
         for obj in _objflow.root:
             obj_id = obj["ObjId"]